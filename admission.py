@@ -0,0 +1,98 @@
+import threading
+import time
+
+
+class JobRejected(Exception):
+    """Raised when a run is not admitted to the job queue."""
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second up to `burst` tokens.
+
+    A rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    def tokens_available(self) -> bool:
+        if not self.rate:
+            return True
+        self._refill()
+        return self._tokens >= 1
+
+    def try_acquire(self) -> bool:
+        if not self.tokens_available():
+            return False
+        if self.rate:
+            self._tokens -= 1
+        return True
+
+    def retry_after(self) -> float:
+        """Seconds until the next token is available."""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+
+class AdmissionController:
+    """Admission policy in front of the job queue.
+
+    Submissions are rate limited per user and globally with token buckets,
+    and a user may only have `per_user_active` runs queued or running at
+    once. Once admitted, at most `per_user_running` runs of a user and
+    `max_running` runs overall are executed concurrently; the rest wait in
+    the queue.
+    """
+
+    def __init__(
+        self,
+        per_user_active: int,
+        per_user_running: int,
+        max_running: int,
+        user_rate: float,
+        user_burst: int,
+        global_rate: float,
+        global_burst: int,
+    ) -> None:
+        self.per_user_active = per_user_active
+        self.per_user_running = per_user_running
+        self.max_running = max_running
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self._global_bucket = TokenBucket(global_rate, global_burst)
+        self._user_buckets: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def admit(self, user_id: str, user_active: int) -> None:
+        """Admit a submission or raise `JobRejected` with the reason."""
+        if user_active >= self.per_user_active:
+            raise JobRejected(
+                f"You already have {user_active} runs in progress, "
+                "please wait for one of them to finish."
+            )
+        with self._lock:
+            bucket = self._user_buckets.setdefault(
+                user_id, TokenBucket(self.user_rate, self.user_burst)
+            )
+            if bucket.tokens_available() and self._global_bucket.try_acquire():
+                bucket.try_acquire()
+                return
+            retry_after = max(bucket.retry_after(), self._global_bucket.retry_after())
+        raise JobRejected(
+            f"Too many runs were submitted recently, please retry in {retry_after:.0f}s."
+        )
+
+    def can_start(self, user_running: int, total_running: int) -> bool:
+        return user_running < self.per_user_running and total_running < self.max_running
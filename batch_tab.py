@@ -0,0 +1,283 @@
+import time
+
+import streamlit as st
+
+from admission import JobRejected
+from batches import (
+    ITEM_PENDING,
+    ITEM_RETRYING,
+    Batch,
+    get_batch_scheduler,
+    list_organization_repositories,
+    parse_repository_list,
+)
+from config_store import get_base_configuration
+from downloads import get_download_registry
+from jobs import JOB_FINISHED, JOB_RUNNING
+from logger_config import logger
+from main_tab import create_osa_job
+
+
+def _collect_repository_urls() -> list[str]:
+    batch_configuration = st.session_state.configuration["batch"]
+    if st.session_state.batch_source == "Organisation":
+        return list_organization_repositories(
+            st.session_state.batch_organization.strip(),
+            api_url=batch_configuration["github-api"],
+            token=st.session_state.git_token,
+            timeout=batch_configuration["github-timeout"],
+        )
+    text = st.session_state.batch_urls
+    if st.session_state.get("batch_file") is not None:
+        text += "\n" + st.session_state.batch_file.getvalue().decode(errors="replace")
+    return parse_repository_list(text)
+
+
+def _submit_batch() -> None:
+    batch_configuration = st.session_state.configuration["batch"]
+    st.session_state.pop("batch_error", None)
+    try:
+        repo_urls = _collect_repository_urls()
+    except ValueError as e:
+        st.session_state.batch_error = str(e)
+        return
+    if not repo_urls:
+        st.session_state.batch_error = "No repositories found."
+        return
+    if len(repo_urls) > batch_configuration["max-repositories"]:
+        st.session_state.batch_error = (
+            f"A batch may contain at most {batch_configuration['max-repositories']} "
+            f"repositories, got {len(repo_urls)}."
+        )
+        return
+    try:
+        batch = get_batch_scheduler().submit(
+            user_id=st.user.get("email") or st.user.get("name", "Username"),
+            directory=st.session_state.tmpdirname,
+            repo_urls=repo_urls,
+            create_job=create_osa_job,
+            parallelism=st.session_state.batch_parallelism,
+            retries=batch_configuration["retries"],
+        )
+    except JobRejected as e:
+        st.session_state.batch_error = str(e)
+        return
+    st.session_state.batch_id = batch.id
+    st.session_state.pop("batch_archive_url", None)
+    st.query_params["batch"] = batch.id
+
+
+def _cancel_batch() -> None:
+    get_batch_scheduler().cancel(st.session_state.batch_id)
+
+
+def _new_batch() -> None:
+    del st.session_state["batch_id"]
+    st.query_params.pop("batch", None)
+    st.session_state.pop("batch_archive_url", None)
+
+
+def render_batch_input() -> None:
+    batch_configuration = st.session_state.configuration["batch"]
+    st.container(height=5, border=False)
+    st.markdown(
+        '<h3 style="text-align: center;">Process many repositories at once: </h3>',
+        unsafe_allow_html=True,
+    )
+    st.container(height=5, border=False)
+    with st.container(border=True):
+        source = st.radio(
+            "Repositories",
+            key="batch_source",
+            options=("URL list", "Organisation"),
+            horizontal=True,
+        )
+        if source == "Organisation":
+            st.text_input(
+                label="GitHub organisation",
+                key="batch_organization",
+                help="""All non-archived repositories of the organisation or user are processed
+                    **Example: aimclub**""",
+                placeholder="aimclub",
+            )
+        else:
+            left, right = st.columns(2, gap="medium")
+            with left:
+                st.text_area(
+                    label="Repository URLs",
+                    key="batch_urls",
+                    height=150,
+                    help="One GitHub repository URL per line",
+                    placeholder="https://github.com/aimclub/OSA",
+                )
+            with right:
+                st.file_uploader(
+                    "Upload a list of URLs",
+                    key="batch_file",
+                    type=["txt", "csv"],
+                )
+        st.number_input(
+            label="Parallel runs",
+            key="batch_parallelism",
+            min_value=1,
+            max_value=batch_configuration["max-parallelism"],
+            value=batch_configuration["parallelism"],
+            help=f"""Number of repositories of the batch processed at the same time  
+                `Default: {batch_configuration["parallelism"]}`""",
+        )
+        st.markdown(
+            f"**NOTE**: Runs use the **{st.session_state.mode_select}** mode and "
+            "configuration selected on the Home tab."
+        )
+        create_pull_requests = not st.session_state.configuration[
+            st.session_state.mode_select
+        ]["git"]["no-pull-request"]
+        confirmed = True
+        if create_pull_requests:
+            confirmed = st.checkbox(
+                "I want to create a public Pull Request in every repository of the batch",
+                key="batch_confirm_pull_requests",
+            )
+
+    if "batch_error" in st.session_state:
+        st.error(st.session_state.batch_error, icon=":material/error:")
+    st.button(
+        "Run Batch",
+        icon=":material/emoji_nature:",
+        use_container_width=True,
+        type="primary",
+        disabled=not confirmed
+        or (
+            source == "Organisation"
+            and not st.session_state.get("batch_organization", "").strip()
+        )
+        or (
+            source != "Organisation"
+            and not st.session_state.get("batch_urls", "").strip()
+            and st.session_state.get("batch_file") is None
+        ),
+        on_click=_submit_batch,
+    )
+
+
+def _render_batch_table(batch: Batch) -> None:
+    now = time.time()
+    rows = []
+    for item in batch.items:
+        job = item.job
+        if item.status in (ITEM_PENDING, ITEM_RETRYING) or job.started_at is None:
+            duration = None
+        else:
+            duration = round((job.finished_at or now) - job.started_at)
+        rows.append(
+            {
+                "Repository": item.repo_url,
+                "Status": item.display_status,
+                "Attempts": item.attempts,
+                "Duration, s": duration,
+                "Reports": len(job.output_report_paths) if item.done else None,
+                "Message": job.error or job.output_message.replace("*", ""),
+            }
+        )
+    st.dataframe(
+        rows,
+        hide_index=True,
+        use_container_width=True,
+        column_config={"Repository": st.column_config.LinkColumn()},
+    )
+
+
+# NOTE: The interval is read when the module is imported, a plain setting
+# keeps that from starting the job queue
+@st.fragment(run_every=get_base_configuration()["jobs"]["poll-interval"])
+def render_batch_progress() -> None:
+    batch = get_batch_scheduler().get(st.session_state.batch_id)
+    if batch is None or batch.done:
+        st.rerun(scope="app")
+
+    done = sum(1 for item in batch.items if item.done)
+    running = sum(1 for item in batch.items if item.display_status == JOB_RUNNING)
+    left, right = st.columns([0.8, 0.2], vertical_alignment="center")
+    with left:
+        st.progress(
+            done / len(batch.items),
+            text=f"{done} of {len(batch.items)} repositories done, {running} in progress"
+            + (" (cancelling...)" if batch.cancelled else ""),
+        )
+    with right:
+        st.button(
+            "Cancel",
+            icon=":material/cancel:",
+            use_container_width=True,
+            disabled=batch.cancelled,
+            on_click=_cancel_batch,
+        )
+    _render_batch_table(batch)
+
+
+def render_batch_results(batch: Batch) -> None:
+    finished = sum(1 for item in batch.items if item.status == JOB_FINISHED)
+    left, right = st.columns([0.6, 0.4], vertical_alignment="center")
+    with left:
+        message = f"{finished} of {len(batch.items)} repositories processed"
+        if finished == len(batch.items):
+            st.success(message, icon=":material/check_circle:")
+        else:
+            st.warning(message, icon=":material/warning:")
+    with right:
+        if "batch_archive_url" not in st.session_state:
+            archive_path = get_batch_scheduler().archive(batch)
+            st.session_state.batch_archive_url = archive_path and (
+                get_download_registry().register(
+                    archive_path,
+                    f"osa_reports_{batch.id[:8]}.zip",
+                    "application/zip",
+                )
+            )
+        if st.session_state.batch_archive_url:
+            st.link_button(
+                "Download All Reports",
+                url=st.session_state.batch_archive_url,
+                icon=":material/download:",
+                use_container_width=True,
+            )
+        else:
+            with st.container(border=True):
+                st.markdown(
+                    '<p style="text-align: center;">No PDF reports were created.</p>',
+                    unsafe_allow_html=True,
+                )
+        st.button(
+            "New Batch",
+            icon=":material/add:",
+            use_container_width=True,
+            on_click=_new_batch,
+        )
+    _render_batch_table(batch)
+
+
+def render_batch_tab() -> None:
+    _, center, _ = st.columns([0.1, 0.8, 0.1])
+    with center:
+        batch = None
+        if "batch_id" not in st.session_state and "batch" in st.query_params:
+            # NOTE: A reloaded page reattaches to the batch named in its URL
+            st.session_state.batch_id = st.query_params["batch"]
+        if "batch_id" in st.session_state:
+            batch = get_batch_scheduler().get(st.session_state.batch_id)
+            if batch is not None and batch.user_id != (
+                st.user.get("email") or st.user.get("name", "Username")
+            ):
+                batch = None
+            if batch is None:
+                logger.warning(f"Batch {st.session_state.batch_id} was lost")
+                del st.session_state["batch_id"]
+                st.query_params.pop("batch", None)
+        if batch is None:
+            render_batch_input()
+        elif batch.done:
+            st.container(height=5, border=False)
+            render_batch_results(batch)
+        else:
+            st.container(height=5, border=False)
+            render_batch_progress()
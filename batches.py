@@ -0,0 +1,380 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+import zipfile
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable
+
+import streamlit as st
+
+from admission import JobRejected
+from config_store import get_base_configuration
+from jobs import (
+    JOB_CANCELLED,
+    JOB_FAILED,
+    JOB_FINISHED,
+    Job,
+    JobQueue,
+    get_job_queue,
+)
+from logger_config import logger
+
+ITEM_PENDING = "pending"
+ITEM_SUBMITTED = "submitted"
+ITEM_RETRYING = "retrying"
+
+ITEM_DONE_STATUSES = (JOB_FINISHED, JOB_FAILED, JOB_CANCELLED)
+
+_REPO_URL_RE = re.compile(r"^https://github\.com/[\w.-]+/[\w.-]+$")
+
+
+def parse_repository_list(text: str) -> list[str]:
+    """Extract GitHub repository URLs from pasted or uploaded text.
+
+    URLs may be separated by newlines, commas or spaces; `#` starts a comment.
+    Duplicates are dropped and the order is kept.
+    """
+    urls = []
+    for line in text.splitlines():
+        for token in re.split(r"[\s,;]+", line.split("#", 1)[0]):
+            url = token.strip().removesuffix("/").removesuffix(".git")
+            if not url:
+                continue
+            if not _REPO_URL_RE.match(url):
+                raise ValueError(f"Not a GitHub repository URL: {token}")
+            urls.append(url)
+    return list(dict.fromkeys(urls))
+
+
+def list_organization_repositories(
+    organization: str, api_url: str, token: str | None, timeout: float
+) -> list[str]:
+    """List the non-archived repositories of a GitHub organisation or user."""
+    headers = {"Accept": "application/vnd.github+json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    urls = []
+    owner = urllib.parse.quote(organization)
+    for kind in ("orgs", "users"):
+        page = 1
+        try:
+            while True:
+                request = urllib.request.Request(
+                    f"{api_url.rstrip('/')}/{kind}/{owner}/repos?per_page=100&page={page}",
+                    headers=headers,
+                )
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    repositories = json.load(response)
+                urls.extend(
+                    repository["html_url"]
+                    for repository in repositories
+                    if not repository.get("archived")
+                )
+                if len(repositories) < 100:
+                    return urls
+                page += 1
+        except urllib.error.HTTPError as e:
+            # NOTE: User accounts are only listed under /users
+            if e.code == 404 and kind == "orgs":
+                continue
+            raise ValueError(f"Could not list repositories of {organization}: {e!s}")
+        except (urllib.error.URLError, OSError, json.JSONDecodeError) as e:
+            raise ValueError(f"Could not list repositories of {organization}: {e!s}")
+    return urls
+
+
+@dataclass
+class BatchItem:
+    """A repository of a batch and its current run."""
+
+    repo_url: str
+    job: Job
+    status: str = ITEM_PENDING
+    attempts: int = 0
+    retry_at: float = 0.0
+
+    @property
+    def done(self) -> bool:
+        return self.status in ITEM_DONE_STATUSES
+
+    @property
+    def display_status(self) -> str:
+        return self.job.status if self.status == ITEM_SUBMITTED else self.status
+
+
+@dataclass
+class Batch:
+    """Runs of many repositories submitted together by a user."""
+
+    id: str
+    user_id: str
+    directory: str
+    items: list[BatchItem]
+    parallelism: int
+    retries: int
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    cancelled: bool = False
+    archive_path: str | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    def report_paths(self) -> list[tuple[BatchItem, str]]:
+        return [
+            (item, path)
+            for item in self.items
+            if item.status == JOB_FINISHED
+            for path in item.job.output_report_paths
+        ]
+
+
+def _clear_attempt(directory: str) -> None:
+    """Remove what a failed attempt left in its directory, except run logs."""
+    for name in os.listdir(directory):
+        if name.endswith(".log"):
+            continue
+        path = os.path.join(directory, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def is_transient_failure(job: Job) -> bool:
+    """Check whether a run failed in a way another attempt may not.
+
+    Runs stopped by their limits or cancelled are not retried, as are runs
+    that finished successfully.
+    """
+    if job.status == JOB_FAILED:
+        return True
+    return (
+        job.status == JOB_FINISHED
+        and job.output_exit_code != 0
+        and job.termination_reason is None
+    )
+
+
+class BatchScheduler:
+    """Fans batches out over the job queue.
+
+    Each batch keeps at most `parallelism` runs in the queue at once, so
+    large batches never crowd out single runs of other users. Runs failing
+    transiently are retried up to `retries` times, the first retry after
+    `retry_delay` seconds and every next one after twice the previous delay.
+    """
+
+    def __init__(
+        self,
+        job_queue: JobQueue,
+        per_user_active: int,
+        retry_delay: float,
+        retention: float,
+        poll_interval: float,
+    ) -> None:
+        self.job_queue = job_queue
+        self.per_user_active = per_user_active
+        self.retry_delay = retry_delay
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self._batches: dict[str, Batch] = {}
+        # NOTE: Batches being created count towards the limit of their user
+        self._creating: Counter[str] = Counter()
+        self._condition = threading.Condition()
+        self._archive_lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._loop, name="batch-scheduler", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def submit(
+        self,
+        user_id: str,
+        directory: str,
+        repo_urls: list[str],
+        create_job: Callable[[str, str, str], Job],
+        parallelism: int,
+        retries: int,
+    ) -> Batch:
+        """Create a batch, `create_job(repo_url, output_dir, batch_id)` makes its runs."""
+        with self._condition:
+            active = self._creating[user_id] + sum(
+                1
+                for batch in self._batches.values()
+                if batch.user_id == user_id and not batch.done
+            )
+            if active >= self.per_user_active:
+                raise JobRejected(
+                    f"You already have {active} batches in progress, "
+                    "please wait for one of them to finish."
+                )
+            self._creating[user_id] += 1
+        batch = None
+        try:
+            batch_id = uuid.uuid4().hex
+            batch_directory = os.path.join(directory, f"batch_{batch_id}")
+            items = []
+            for i, repo_url in enumerate(repo_urls):
+                output_dir = os.path.join(
+                    batch_directory, f"{i:04d}_{repo_url.rsplit('/', 1)[-1]}"
+                )
+                os.makedirs(output_dir)
+                items.append(
+                    BatchItem(repo_url, create_job(repo_url, output_dir, batch_id))
+                )
+            batch = Batch(
+                id=batch_id,
+                user_id=user_id,
+                directory=batch_directory,
+                items=items,
+                parallelism=parallelism,
+                retries=retries,
+            )
+        finally:
+            with self._condition:
+                self._creating[user_id] -= 1
+                if not self._creating[user_id]:
+                    del self._creating[user_id]
+                if batch is not None:
+                    self._batches[batch.id] = batch
+                    self._condition.notify_all()
+        logger.info(
+            f"Created batch {batch.id} of {len(items)} repositories for {user_id}"
+        )
+        return batch
+
+    def get(self, batch_id: str) -> Batch | None:
+        with self._condition:
+            return self._batches.get(batch_id)
+
+    def cancel(self, batch_id: str) -> None:
+        with self._condition:
+            batch = self._batches.get(batch_id)
+            if batch is None or batch.done:
+                return
+            batch.cancelled = True
+            for item in batch.items:
+                if item.status == ITEM_SUBMITTED:
+                    self.job_queue.cancel(item.job.id)
+                elif not item.done:
+                    item.status = JOB_CANCELLED
+            self._condition.notify_all()
+        logger.info(f"Cancelled batch {batch_id}")
+
+    def archive(self, batch: Batch) -> str | None:
+        """Pack the reports of a finished batch into a zip archive."""
+        if not batch.done:
+            return None
+        with self._archive_lock:
+            if batch.archive_path is None and (reports := batch.report_paths()):
+                archive_path = os.path.join(batch.directory, "reports.zip")
+                # NOTE: PDF reports are compressed already
+                with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_STORED) as archive:
+                    for item, path in reports:
+                        owner, name = item.repo_url.rsplit("/", 2)[-2:]
+                        archive.write(path, f"{owner}_{name}/{os.path.basename(path)}")
+                batch.archive_path = archive_path
+            return batch.archive_path
+
+    def _complete(self, batch: Batch, item: BatchItem) -> None:
+        job = item.job
+        if job.status == JOB_CANCELLED:
+            item.status = JOB_CANCELLED
+        elif not is_transient_failure(job):
+            item.status = JOB_FINISHED if job.output_exit_code == 0 else JOB_FAILED
+        elif item.attempts <= batch.retries and not batch.cancelled:
+            delay = self.retry_delay * 2 ** (item.attempts - 1)
+            logger.info(
+                f"Retrying {item.repo_url} of batch {batch.id} in {delay:.0f}s "
+                f"after attempt {item.attempts} failed"
+            )
+            _clear_attempt(job.tmpdirname)
+            item.job = job.new_attempt()
+            item.status = ITEM_RETRYING
+            item.retry_at = time.time() + delay
+        else:
+            item.status = JOB_FAILED
+
+    def _schedule(self, batch: Batch) -> None:
+        in_flight = 0
+        for item in batch.items:
+            if item.status == ITEM_SUBMITTED:
+                if item.job.done:
+                    self._complete(batch, item)
+                else:
+                    in_flight += 1
+
+        now = time.time()
+        for item in batch.items:
+            if in_flight >= batch.parallelism or batch.cancelled:
+                break
+            if item.status not in (ITEM_PENDING, ITEM_RETRYING) or item.retry_at > now:
+                continue
+            try:
+                self.job_queue.submit(item.job)
+            except JobRejected as e:
+                # NOTE: The queue is full, try again once runs have finished
+                logger.debug(f"Batch {batch.id} waits for the queue: {e!s}")
+                break
+            item.status = ITEM_SUBMITTED
+            item.attempts += 1
+            in_flight += 1
+
+        if all(item.done for item in batch.items):
+            batch.finished_at = time.time()
+            logger.info(
+                f"Batch {batch.id} finished: "
+                f"{sum(1 for item in batch.items if item.status == JOB_FINISHED)} "
+                f"of {len(batch.items)} repositories processed"
+            )
+
+    def _loop(self) -> None:
+        while True:
+            with self._condition:
+                deadline = time.time() - self.retention
+                for batch_id in [
+                    batch.id
+                    for batch in self._batches.values()
+                    if batch.done and batch.finished_at < deadline
+                ]:
+                    del self._batches[batch_id]
+                for batch in self._batches.values():
+                    if batch.done:
+                        continue
+                    try:
+                        self._schedule(batch)
+                    except Exception as e:
+                        logger.error(
+                            f"Scheduling batch {batch.id} failed: {e!s}", exc_info=True
+                        )
+                self._condition.wait(self.poll_interval)
+
+
+@st.cache_resource
+def get_batch_scheduler() -> BatchScheduler:
+    config = get_base_configuration()
+    batch_config = config["batch"]
+    scheduler = BatchScheduler(
+        get_job_queue(),
+        per_user_active=batch_config["per-user-active"],
+        retry_delay=batch_config["retry-delay"],
+        retention=config["jobs"]["retention"],
+        poll_interval=config["jobs"]["poll-interval"],
+    )
+    scheduler.start()
+    return scheduler
@@ -0,0 +1,213 @@
+"""Throughput of the web layer, with a stand-in osa-tool instead of real runs.
+
+Usage: python benchmarks/bench_app.py [--lines N ...] [--sessions N] [--json PATH]
+
+Run it from the repository root with the app's dependencies installed;
+the paths of config.toml must be writable. benchmarks/fake_osa_tool.py
+is put on PATH as osa-tool, and for every run size the suite measures:
+
+- the overhead of run_osa_tool over reading the same output directly,
+- the rerun latency of the Home page while the run streams output,
+  and the time until the session shows its results.
+
+The rerun latency of an idle Home page and the memory allocated per
+session are measured once.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+from streamlit.testing.v1.element_tree import ButtonGroup  # noqa: E402
+
+FAKE_OSA_TOOL = pathlib.Path(__file__).resolve().parent / "fake_osa_tool.py"
+
+
+def _app() -> None:
+    import streamlit as st
+
+    class _User(dict):
+        is_logged_in = True
+
+    st.user = _User(name="Benchmark", email="benchmark@example.com")
+
+    import streamlit_app
+
+    streamlit_app.main()
+
+
+def _selected_indices(self: ButtonGroup) -> list[int]:
+    return [self.options.index(self.format_func(v)) for v in self.value or []]
+
+
+# NOTE: AppTest fails to send the state of a single-select st.pills without
+# a selection, such as the attachment pills of a session without attachment
+ButtonGroup.indices = property(_selected_indices)
+
+
+def new_session() -> AppTest:
+    at = AppTest.from_function(_app, default_timeout=60)
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return at
+
+
+def timed_run(at: AppTest) -> float:
+    started_at = time.perf_counter()
+    at.run()
+    return time.perf_counter() - started_at
+
+
+def summary(timings: list[float]) -> dict[str, float]:
+    timings = sorted(timings)
+    # NOTE: quantiles() needs two samples, a single one is every percentile
+    p95 = (
+        statistics.quantiles(timings, n=100, method="inclusive")[94]
+        if len(timings) > 1
+        else timings[0]
+    )
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 2),
+        "p95_ms": round(p95 * 1000, 2),
+        "max_ms": round(timings[-1] * 1000, 2),
+    }
+
+
+def bench_idle_reruns(reruns: int) -> dict[str, float]:
+    at = new_session()
+    return summary([timed_run(at) for _ in range(reruns)])
+
+
+def bench_session_memory(sessions: int) -> float:
+    """Return the memory allocated by the app per session, in kilobytes."""
+    new_session()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [new_session() for _ in range(sessions)]
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return round(allocated / sessions / 1024, 1)
+
+
+async def _read_directly(cmd: list[str], output_dir: str) -> None:
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=os.environ | {"PYTHONUNBUFFERED": "1"},
+        cwd=output_dir,
+    )
+    while await process.stdout.readline():
+        pass
+    await process.stderr.read()
+    await process.wait()
+
+
+def bench_run_osa_tool(lines: int) -> dict[str, float]:
+    from jobs import Job
+    from log_store import RunLog
+    from utils import OSA_ENV, run_osa_tool
+
+    os.environ["FAKE_OSA_LINES"] = str(lines)
+    with tempfile.TemporaryDirectory() as output_dir:
+        cmd = [
+            "osa-tool",
+            "-r",
+            "https://github.com/a/b",
+            "-o",
+            output_dir,
+            "--no-pull-request",
+        ]
+        started_at = time.perf_counter()
+        asyncio.run(_read_directly(cmd, output_dir))
+        direct = time.perf_counter() - started_at
+
+        job = Job(
+            cmd=cmd,
+            env=os.environ | OSA_ENV,
+            user="Benchmark",
+            user_id="benchmark@example.com",
+            repo_url="https://github.com/a/b",
+            mode="fast",
+            tmpdirname=output_dir,
+            run_log=RunLog(os.path.join(output_dir, "osa_run.log")),
+        )
+        started_at = time.perf_counter()
+        asyncio.run(run_osa_tool(job))
+        job.run_log.close()
+        wrapped = time.perf_counter() - started_at
+    if job.output_exit_code != 0:
+        raise RuntimeError(f"Run failed: {job.output_message}")
+    return {
+        "direct_s": round(direct, 3),
+        "run_osa_tool_s": round(wrapped, 3),
+        "overhead_us_per_line": round((wrapped - direct) / lines * 1e6, 2),
+    }
+
+
+def bench_app_run(lines: int) -> dict[str, float]:
+    os.environ["FAKE_OSA_LINES"] = str(lines)
+    at = new_session()
+    at.text_input(key="repo_url").set_value("https://github.com/a/b").run()
+    at.checkbox(key="configuration-git-no-pull-request").check().run()
+    started_at = time.perf_counter()
+    next(button for button in at.button if button.label == "Run OSA").click().run()
+    reruns = []
+    while at.session_state.running:
+        reruns.append(timed_run(at))
+    elapsed = time.perf_counter() - started_at
+    if at.session_state.output_exit_code != 0:
+        raise RuntimeError(f"Run failed: {at.session_state.output_message}")
+    return {
+        "end_to_end_s": round(elapsed, 3),
+        "reruns": len(reruns),
+        **{f"rerun_{key}": value for key, value in summary(reruns or [0.0]).items()},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--reruns", type=int, default=50)
+    parser.add_argument("--json", type=pathlib.Path, help="Also write results here")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    bin_dir = tempfile.mkdtemp(prefix="fake-osa-tool-")
+    os.symlink(FAKE_OSA_TOOL, os.path.join(bin_dir, "osa-tool"))
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+
+    results = {
+        "idle_rerun": bench_idle_reruns(args.reruns),
+        "session_memory_kb": bench_session_memory(args.sessions),
+        "runs": {},
+    }
+    print(f"idle rerun: {results['idle_rerun']}")
+    print(f"memory per session: {results['session_memory_kb']} KB")
+    for lines in args.lines:
+        results["runs"][lines] = run = {
+            **bench_run_osa_tool(lines),
+            **bench_app_run(lines),
+        }
+        print(f"{lines} lines: {run}")
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Time to first output of osa-tool runs, new processes against the fork server.
+
+Usage: python benchmarks/bench_fork_server.py [--runs N] [--script osa-tool] [ARGS ...]
+
+ARGS are passed to the script, `--help` by default: it prints right after
+osa_tool is imported, so the timings are dominated by startup.
+"""
+
+import argparse
+import asyncio
+import os
+import pathlib
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from fork_server import ForkServer  # noqa: E402
+
+ENV = os.environ | {"COLUMNS": "200", "TERM": "xterm-256color", "PYTHONUNBUFFERED": "1"}
+
+
+async def time_to_first_output(start) -> float:
+    """Start a run and return the seconds until its first stdout line."""
+    started_at = time.perf_counter()
+    process = await start()
+    await process.stdout.readline()
+    elapsed = time.perf_counter() - started_at
+    await process.stdout.read()
+    await process.stderr.read()
+    await process.wait()
+    return elapsed
+
+
+async def bench(
+    cmd: list[str], runs: int, fork_server: ForkServer | None
+) -> list[float]:
+    if fork_server is None:
+
+        async def start():
+            return await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=ENV,
+                start_new_session=True,
+            )
+
+    else:
+
+        async def start():
+            return await fork_server.spawn(cmd, ENV)
+
+    return [await time_to_first_output(start) for _ in range(runs)]
+
+
+def report(name: str, timings: list[float]) -> None:
+    print(
+        f"{name}: median {statistics.median(timings) * 1000:.1f} ms, "
+        f"min {min(timings) * 1000:.1f} ms, max {max(timings) * 1000:.1f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--script", default="osa-tool")
+    parser.add_argument("args", nargs="*", default=["--help"])
+    args = parser.parse_args()
+    cmd = [args.script, *args.args]
+
+    fork_server = ForkServer(args.script, env=ENV, start_timeout=120)
+    started_at = time.perf_counter()
+    fork_server.start()
+    # NOTE: Warm up, the first fork also waits for the server to import osa_tool
+    asyncio.run(bench(cmd, 1, fork_server))
+    print(f"fork server ready in {time.perf_counter() - started_at:.2f} s")
+
+    try:
+        cold = asyncio.run(bench(cmd, args.runs, None))
+        warm = asyncio.run(bench(cmd, args.runs, fork_server))
+    finally:
+        fork_server.close()
+    report("new process", cold)
+    report("fork server", warm)
+    print(f"speedup {statistics.median(cold) / statistics.median(warm):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
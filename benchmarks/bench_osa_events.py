@@ -0,0 +1,53 @@
+"""Microbenchmark of osa-tool output parsing over recorded transcripts.
+
+Usage: python benchmarks/bench_osa_events.py [TRANSCRIPT ...]
+"""
+
+import argparse
+import pathlib
+import re
+import sys
+import timeit
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from osa_events import parse_osa_line  # noqa: E402
+
+TRANSCRIPTS_DIR = pathlib.Path(__file__).resolve().parent / "transcripts"
+
+
+def legacy_parse(line: str) -> None:
+    """Per-line parsing as done before the event parser was introduced."""
+    re.search(r"PDF report successfully created in (\/.*.pdf)", line)
+    re.search(
+        r"(.*You can add the following.*|.*- Description:.*|.*- Homepage:.*|.*- Topics:.*|.*Please review and add them to your repository.*)",
+        line,
+    )
+    re.search(r".*pull request created successfully: (\S*)", line)
+
+
+def bench(lines: list[str], parse, repeat: int) -> float:
+    """Return the best time per line in nanoseconds."""
+    timer = timeit.Timer(lambda: [parse(line) for line in lines])
+    return min(timer.repeat(repeat=repeat, number=1)) / len(lines) * 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("transcripts", nargs="*", type=pathlib.Path)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for path in args.transcripts or sorted(TRANSCRIPTS_DIR.glob("*.log")):
+        lines = [line.strip() for line in path.read_text().splitlines() if line.strip()]
+        legacy = bench(lines, legacy_parse, args.repeat)
+        current = bench(lines, parse_osa_line, args.repeat)
+        print(
+            f"{path.name}: {len(lines)} lines, "
+            f"legacy {legacy:.0f} ns/line, event parser {current:.0f} ns/line "
+            f"({legacy / current:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Stand-in for the osa-tool executable, for benchmarks without LLMs or GitHub.
+
+Link it as `osa-tool` into a directory on PATH. It accepts the osa-tool
+command line, ignores everything but `-r`, `-o` and `--no-pull-request`,
+and is configured through the environment:
+
+    FAKE_OSA_TRANSCRIPT  replay a recorded osa-tool transcript
+    FAKE_OSA_LINES       otherwise print this many log lines (default 1000)
+    FAKE_OSA_RATE        lines per second, 0 = as fast as possible (default 0)
+    FAKE_OSA_SPEED       replay transcripts this many times faster than
+                         recorded, 0 = as fast as possible (default 0)
+    FAKE_OSA_EXIT        exit code (default 0)
+
+Runs print the clone and stage headers, the About section and pull request
+markers, and create a fake PDF report in the output directory, so the web
+app processes them like real runs.
+"""
+
+import datetime
+import os
+import random
+import re
+import sys
+import time
+
+TIMESTAMP_RE = re.compile(r"^\[(\d\d:\d\d:\d\d)\]")
+REPORT_RE = re.compile(r"PDF report successfully created in \S+")
+PR_RE = re.compile(r"pull request created successfully: \S+")
+
+STAGES = (
+    "Report generation",
+    "Docstrings generation",
+    "README generation",
+    "About Section generation",
+    "Publishing changes",
+)
+MESSAGES = (
+    "Processing file osa_tool/{name}.py",
+    "Sending request to LLM for osa_tool/{name}.py",
+    "Token usage: prompt={number} completion={number}",
+    "Generated docstring for function parse_{number} in osa_tool/{name}.py",
+    "Waiting for rate limit...",
+)
+FAKE_PDF = (
+    b"%PDF-1.4\n1 0 obj << /Type /Catalog >> endobj\ntrailer << /Root 1 0 R >>\n%%EOF\n"
+)
+
+
+def argument(args: list[str], *names: str, default: str = "") -> str:
+    for name in names:
+        if name in args[:-1]:
+            return args[args.index(name) + 1]
+    return default
+
+
+def log(message: str) -> None:
+    now = datetime.datetime.now().strftime("%H:%M:%S")
+    print(f"[{now}] INFO     [{now}] - {message}")
+
+
+def rule(title: str) -> None:
+    print()
+    print(f" {title} ".center(200, "─"))
+
+
+def write_report(output_dir: str, repo_name: str) -> str:
+    report_dir = os.path.join(output_dir, repo_name)
+    os.makedirs(report_dir, exist_ok=True)
+    path = os.path.join(report_dir, f"{repo_name}_report.pdf")
+    with open(path, "wb") as file:
+        file.write(FAKE_PDF)
+    return path
+
+
+def replay(path: str, speed: float, report_path: str, pr_url: str | None) -> None:
+    previous = None
+    with open(path, encoding="utf-8", errors="replace") as file:
+        for line in file:
+            line = line.rstrip("\n")
+            if speed and (match := TIMESTAMP_RE.match(line)):
+                current = datetime.datetime.strptime(match.group(1), "%H:%M:%S")
+                if previous is not None and current > previous:
+                    sys.stdout.flush()
+                    time.sleep((current - previous).total_seconds() / speed)
+                previous = current
+            line = REPORT_RE.sub(
+                f"PDF report successfully created in {report_path}", line
+            )
+            if PR_RE.search(line):
+                if pr_url is None:
+                    continue
+                line = PR_RE.sub(f"pull request created successfully: {pr_url}", line)
+            print(line)
+
+
+def synthesize(lines: int, rate: float, report_path: str, pr_url: str | None) -> None:
+    log("Cloning the 'main' branch from the repository...")
+    log("Cloning completed")
+    started_at = time.monotonic()
+    per_stage = max(1, lines // len(STAGES))
+    for i in range(lines):
+        if i % per_stage == 0 and i // per_stage < len(STAGES):
+            stage = STAGES[i // per_stage]
+            rule(stage)
+            if stage == "About Section generation":
+                print("You can add the following to the About section:")
+                print("- Description: Synthetic repository used for benchmarks")
+                print("- Topics: benchmark, osa")
+                print("Please review and add them to your repository")
+        log(
+            random.choice(MESSAGES).format(
+                name=f"module_{i % 97}", number=random.randint(100, 9999)
+            )
+        )
+        if i == per_stage - 1:
+            log(f"PDF report successfully created in {report_path}")
+        if rate:
+            # NOTE: Flush as a real unbuffered osa-tool would, at the target pace
+            sys.stdout.flush()
+            delay = started_at + (i + 1) / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    if pr_url is not None:
+        log(f"GitHub pull request created successfully: {pr_url}")
+    rule("All operations completed successfully in total time: 0h 0m 1s")
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    repo_url = argument(args, "-r", "--repository", default="https://github.com/a/b")
+    output_dir = argument(args, "-o", "--output", default=os.getcwd())
+    repo_name = repo_url.rstrip("/").rsplit("/", 1)[-1] or "repository"
+    pr_url = None if "--no-pull-request" in args else f"{repo_url}/pull/1"
+
+    report_path = write_report(output_dir, repo_name)
+    if transcript := os.environ.get("FAKE_OSA_TRANSCRIPT"):
+        replay(
+            transcript,
+            float(os.environ.get("FAKE_OSA_SPEED", 0)),
+            report_path,
+            pr_url,
+        )
+    else:
+        synthesize(
+            int(os.environ.get("FAKE_OSA_LINES", 1000)),
+            float(os.environ.get("FAKE_OSA_RATE", 0)),
+            report_path,
+            pr_url,
+        )
+    sys.stdout.flush()
+    sys.exit(int(os.environ.get("FAKE_OSA_EXIT", 0)))
+
+
+if __name__ == "__main__":
+    main()
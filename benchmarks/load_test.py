@@ -0,0 +1,379 @@
+"""Load test of one OSA.Web server with an increasing number of sessions.
+
+Usage: python benchmarks/load_test.py [--sessions K ...] [--iterations N]
+                                      [--lines N] [--output PATH]
+
+Starts benchmarks/load_test_app.py (OSA.Web with login mocked) under
+`streamlit run`, with benchmarks/fake_osa_tool.py as osa-tool. Run it
+from the repository root; the paths of config.toml must be writable.
+
+For every K, K simulated sessions connect to the Streamlit websocket as
+different users. Each session repeats, N times: a rerun (tabs switch in
+the browser only, so switching one reruns nothing on the server), a
+configuration change, and a run it follows to its results, rerunning the
+progress fragment like the browser does.
+
+Reported per K: p50/p99 rerun latency (request to script finished),
+websocket bytes, server RSS growth, failed sessions, and runs that
+finished or were not (e.g. rejected by admission control). The results
+are written as JSON for comparing releases.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from dataclasses import dataclass, field
+
+import toml
+from streamlit.proto.Alert_pb2 import Alert
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from streamlit.runtime.state.common import user_key_from_element_id
+from tornado.websocket import websocket_connect
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+BENCHMARKS_DIR = pathlib.Path(__file__).resolve().parent
+
+SCRIPT_FINISHED = (
+    ForwardMsg.FINISHED_SUCCESSFULLY,
+    ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY,
+)
+
+
+class SessionFailed(Exception):
+    """Raised when a simulated session sees an error or stops responding."""
+
+
+@dataclass
+class LevelStats:
+    rerun_latencies: list[float] = field(default_factory=list)
+    bytes_received: int = 0
+    bytes_sent: int = 0
+    failed_sessions: int = 0
+    runs_finished: int = 0
+    runs_not_finished: int = 0
+    errors: list[str] = field(default_factory=list)
+
+
+class LoadTestSession:
+    """A browser tab of OSA.Web, speaking the Streamlit websocket protocol."""
+
+    def __init__(self, url: str, user: str, stats: LevelStats, timeout: float) -> None:
+        self.url = url
+        self.user = user
+        self.stats = stats
+        self.timeout = timeout
+        self._connection = None
+        self._reader: asyncio.Task | None = None
+        self._finished = asyncio.Event()
+        self._page_script_hash = ""
+        # NOTE: Like the frontend, keep the state of every widget and send all of it
+        self._widget_states: dict[str, WidgetState] = {}
+        self._widgets: dict[str, tuple[str, object]] = {}
+        self._auto_reruns: dict[str, float] = {}
+        self._alerts: list[Alert] = []
+        self._last_alerts: list[Alert] = []
+        self._exception: str | None = None
+
+    async def connect(self) -> None:
+        self._connection = await websocket_connect(
+            f"{self.url.replace('http', 'ws', 1)}/_stcore/stream",
+            subprotocols=["streamlit"],
+        )
+        self._reader = asyncio.create_task(self._read())
+        await self.rerun()
+
+    async def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+        if self._reader is not None:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+    async def _read(self) -> None:
+        while (payload := await self._connection.read_message()) is not None:
+            self.stats.bytes_received += len(payload)
+            message = ForwardMsg()
+            message.ParseFromString(payload)
+            self._handle(message)
+        self._exception = self._exception or "Websocket closed by the server"
+        self._finished.set()
+
+    def _handle(self, message: ForwardMsg) -> None:
+        match message.WhichOneof("type"):
+            case "new_session":
+                self._page_script_hash = message.new_session.page_script_hash
+                self._alerts = []
+                if not message.new_session.fragment_ids_this_run:
+                    self._auto_reruns.clear()
+            case "auto_rerun":
+                self._auto_reruns[message.auto_rerun.fragment_id] = (
+                    message.auto_rerun.interval
+                )
+            case "delta" if message.delta.WhichOneof("type") == "new_element":
+                self._handle_element(message.delta.new_element)
+            case "script_finished":
+                if message.script_finished in SCRIPT_FINISHED:
+                    self._last_alerts = self._alerts
+                    self._finished.set()
+
+    def _handle_element(self, element) -> None:
+        kind = element.WhichOneof("type")
+        widget = getattr(element, kind)
+        if kind == "exception":
+            self._exception = f"{widget.type}: {widget.message}"
+        elif kind == "alert":
+            self._alerts.append(widget)
+        elif getattr(widget, "id", ""):
+            # NOTE: Widgets are found by their key, or their label if they have none
+            if key := user_key_from_element_id(widget.id):
+                self._widgets[key] = (kind, widget)
+            self._widgets[f"label:{widget.label}"] = (kind, widget)
+
+    def widget(self, name: str):
+        if name not in self._widgets:
+            raise SessionFailed(f"Widget {name} was not rendered")
+        return self._widgets[name]
+
+    def set_widget(self, name: str, **value) -> None:
+        _, widget = self.widget(name)
+        self._widget_states[widget.id] = WidgetState(id=widget.id, **value)
+
+    def widget_value(self, name: str) -> bool | str:
+        _, widget = self.widget(name)
+        if widget.id in self._widget_states:
+            state = self._widget_states[widget.id]
+            return getattr(state, state.WhichOneof("value"))
+        return widget.value if widget.set_value else widget.default
+
+    async def rerun(self, fragment_id: str = "") -> None:
+        message = BackMsg()
+        client_state = message.rerun_script
+        client_state.query_string = f"user={self.user}"
+        client_state.page_script_hash = self._page_script_hash
+        client_state.widget_states.widgets.extend(self._widget_states.values())
+        if fragment_id:
+            client_state.fragment_id = fragment_id
+            client_state.is_auto_rerun = True
+        # NOTE: Button clicks are sent with a single rerun
+        for widget_id in [
+            widget_id
+            for widget_id, state in self._widget_states.items()
+            if state.WhichOneof("value") == "trigger_value"
+        ]:
+            del self._widget_states[widget_id]
+
+        payload = message.SerializeToString()
+        self._finished.clear()
+        started_at = time.perf_counter()
+        await self._connection.write_message(payload, binary=True)
+        self.stats.bytes_sent += len(payload)
+        try:
+            await asyncio.wait_for(self._finished.wait(), self.timeout)
+        except TimeoutError:
+            raise SessionFailed(f"No response within {self.timeout}s") from None
+        if self._exception is not None:
+            raise SessionFailed(self._exception)
+        self.stats.rerun_latencies.append(time.perf_counter() - started_at)
+
+    async def change_configuration(self) -> None:
+        name = "configuration-general-docstring"
+        self.set_widget(name, bool_value=not self.widget_value(name))
+        await self.rerun()
+
+    async def run_osa(self, repo_url: str, run_timeout: float) -> bool:
+        """Start a run and follow it, return whether it finished successfully."""
+        self.set_widget("repo_url", string_value=repo_url)
+        self.set_widget("configuration-git-no-pull-request", bool_value=True)
+        self.set_widget("label:Run OSA", trigger_value=True)
+        await self.rerun()
+        deadline = time.monotonic() + run_timeout
+        while self.widget("label:Run OSA")[1].disabled:
+            if time.monotonic() > deadline:
+                raise SessionFailed(f"Run did not finish within {run_timeout}s")
+            interval = min(self._auto_reruns.values(), default=1.0)
+            await asyncio.sleep(interval)
+            for fragment_id in list(self._auto_reruns):
+                await self.rerun(fragment_id)
+        return any(alert.format == Alert.SUCCESS for alert in self._last_alerts)
+
+
+async def simulate_session(
+    url: str,
+    user: str,
+    stats: LevelStats,
+    iterations: int,
+    timeout: float,
+    run_timeout: float,
+) -> None:
+    session = LoadTestSession(url, user, stats, timeout)
+    try:
+        await session.connect()
+        for i in range(iterations):
+            await session.rerun()
+            await session.change_configuration()
+            if await session.run_osa(
+                f"https://github.com/load-test/{user}-{i}", run_timeout
+            ):
+                stats.runs_finished += 1
+            else:
+                stats.runs_not_finished += 1
+    except Exception as e:
+        stats.failed_sessions += 1
+        stats.errors.append(f"{user}: {e!s}")
+    finally:
+        await session.close()
+
+
+def server_rss(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def percentile(values: list[float], fraction: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run_level(
+    url: str, pid: int, sessions: int, args: argparse.Namespace
+) -> dict:
+    stats = LevelStats()
+    rss_before = server_rss(pid)
+    started_at = time.perf_counter()
+    await asyncio.gather(
+        *(
+            simulate_session(
+                url,
+                f"load-{sessions}-{i}",
+                stats,
+                args.iterations,
+                args.timeout,
+                args.run_timeout,
+            )
+            for i in range(sessions)
+        )
+    )
+    elapsed = time.perf_counter() - started_at
+    rss_after = server_rss(pid)
+    latencies = stats.rerun_latencies
+    return {
+        "sessions": sessions,
+        "duration_s": round(elapsed, 2),
+        "reruns": len(latencies),
+        "rerun_p50_ms": latencies and round(statistics.median(latencies) * 1000, 1),
+        "rerun_p99_ms": latencies and round(percentile(latencies, 0.99) * 1000, 1),
+        "bytes_received": stats.bytes_received,
+        "bytes_sent": stats.bytes_sent,
+        "rss_before_mb": round(rss_before / 2**20, 1),
+        "rss_after_mb": round(rss_after / 2**20, 1),
+        "rss_growth_mb": round((rss_after - rss_before) / 2**20, 1),
+        "failed_sessions": stats.failed_sessions,
+        "runs_finished": stats.runs_finished,
+        "runs_not_finished": stats.runs_not_finished,
+        "errors": stats.errors[:20],
+    }
+
+
+def start_server(port: int, lines: int, rate: float) -> subprocess.Popen:
+    bin_dir = tempfile.mkdtemp(prefix="fake-osa-tool-")
+    os.symlink(BENCHMARKS_DIR / "fake_osa_tool.py", os.path.join(bin_dir, "osa-tool"))
+    env = os.environ | {
+        "PATH": f"{bin_dir}{os.pathsep}{os.environ['PATH']}",
+        "FAKE_OSA_LINES": str(lines),
+        "FAKE_OSA_RATE": str(rate),
+    }
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "streamlit",
+            "run",
+            str(BENCHMARKS_DIR / "load_test_app.py"),
+            "--server.headless=true",
+            f"--server.port={port}",
+            "--browser.gatherUsageStats=false",
+        ],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(
+                f"http://127.0.0.1:{port}/_stcore/health", timeout=1
+            ):
+                return server
+        except OSError:
+            if server.poll() is not None:
+                break
+            time.sleep(0.5)
+    server.kill()
+    sys.exit("The Streamlit server did not start")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 5, 10, 25])
+    parser.add_argument("--iterations", type=int, default=2)
+    parser.add_argument("--lines", type=int, default=2000, help="Lines per run")
+    parser.add_argument("--rate", type=float, default=1000, help="Lines per second")
+    parser.add_argument("--port", type=int, default=8601)
+    parser.add_argument("--timeout", type=float, default=60, help="Per rerun")
+    parser.add_argument("--run-timeout", type=float, default=600)
+    parser.add_argument("--output", type=pathlib.Path)
+    args = parser.parse_args()
+
+    version = toml.load(ROOT / "config.toml")["versions"]["osa_web"]
+    output = args.output or pathlib.Path(
+        f"load_test_{version}_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    server = start_server(args.port, args.lines, args.rate)
+    url = f"http://127.0.0.1:{args.port}"
+    results = {
+        "version": version,
+        "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "settings": {
+            key: vars(args)[key]
+            for key in ("iterations", "lines", "rate", "timeout", "run_timeout")
+        },
+        "levels": [],
+    }
+    try:
+        for sessions in args.sessions:
+            level = asyncio.run(run_level(url, server.pid, sessions, args))
+            results["levels"].append(level)
+            print(
+                f"{sessions} sessions: p50 {level['rerun_p50_ms']} ms, "
+                f"p99 {level['rerun_p99_ms']} ms, "
+                f"{level['bytes_received'] / 2**20:.1f} MB received, "
+                f"RSS +{level['rss_growth_mb']} MB, "
+                f"{level['failed_sessions']} failed sessions, "
+                f"{level['runs_finished']} runs finished, "
+                f"{level['runs_not_finished']} not"
+            )
+    finally:
+        server.terminate()
+        server.wait()
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""OSA.Web with login mocked, for benchmarks/load_test.py.
+
+Every session is logged in as the user named by its `user` query parameter.
+"""
+
+import pathlib
+import sys
+
+import streamlit as st
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import streamlit_app  # noqa: E402
+
+
+class _LoadTestUser:
+    """Stand-in for `st.user`, read from the query parameters of the session."""
+
+    is_logged_in = True
+
+    def get(self, key: str, default=None):
+        name = st.query_params.get("user", "load-test")
+        return {"name": name, "email": f"{name}@example.invalid"}.get(key, default)
+
+
+# NOTE: st.user is shared by all sessions, the stand-in looks the user up per session
+st.user = _LoadTestUser()
+streamlit_app.main()
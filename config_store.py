@@ -0,0 +1,328 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator, Mapping
+from types import MappingProxyType
+from typing import Any
+
+import streamlit as st
+import toml
+
+
+# NOTE: The app logger is configured from this module's configuration,
+# so it is looked up by name instead of importing logger_config
+logger = logging.getLogger("Streamlit App")
+
+CONFIG_PATH = "config.toml"
+
+# NOTE: Settings of these tables are read once by the app's singletons
+RESTART_SECTIONS = (
+    "paths",
+    "jobs",
+    "sidecar",
+    "metrics",
+    "janitor",
+    "result-cache",
+    "git-mirrors",
+    "admission",
+    "history",
+    "config",
+)
+
+
+def freeze(value: Any) -> Any:
+    """Return an immutable copy: tables become read-only mappings, lists tuples."""
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def _thaw(value: Any) -> Any:
+    if isinstance(value, Mapping):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+def _digest(value: Any) -> str:
+    encoded = json.dumps(_thaw(value), sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _setting_type(value: Any) -> type:
+    if isinstance(value, bool):
+        return bool
+    if isinstance(value, (int, float)):
+        return float
+    return type(value)
+
+
+def validate_configuration(
+    new: Mapping, old: Mapping, path: tuple[str, ...] = ()
+) -> list[str]:
+    """Return what makes `new` unusable in place of `old`.
+
+    Settings may be added, but existing ones must keep their type.
+    """
+    problems = []
+    for key, old_value in old.items():
+        name = ".".join((*path, key))
+        if key not in new:
+            problems.append(f"{name} is missing")
+        elif isinstance(old_value, Mapping):
+            if isinstance(new[key], Mapping):
+                problems += validate_configuration(new[key], old_value, (*path, key))
+            else:
+                problems.append(f"{name} must be a table")
+        elif _setting_type(new[key]) is not _setting_type(old_value):
+            problems.append(
+                f"{name} must be {_setting_type(old_value).__name__}, "
+                f"got {new[key]!r}"
+            )
+    return problems
+
+
+class BaseConfiguration(Mapping):
+    """The parsed config.toml, immutable and shared by all sessions."""
+
+    def __init__(self, data: Mapping, version: int = 1) -> None:
+        self._data = freeze(data)
+        self.version = version
+        self.key = _digest(self._data)
+
+    @classmethod
+    def load(cls, path: str, version: int = 1) -> "BaseConfiguration":
+        return cls(toml.load(path), version)
+
+    def __getitem__(self, key: str) -> Any:
+        return self._data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class _ConfigurationView(Mapping):
+    """A table of a session configuration, the base table with its edits applied."""
+
+    __slots__ = ("_configuration", "_path", "_base")
+
+    def __init__(
+        self,
+        configuration: "SessionConfiguration",
+        path: tuple[str, ...],
+        base: Mapping,
+    ) -> None:
+        self._configuration = configuration
+        self._path = path
+        self._base = base
+
+    def __getitem__(self, key: str) -> Any:
+        return self._configuration._lookup((*self._path, key), self._base.get(key))
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._configuration.set((*self._path, key), value)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._base or (*self._path, key) in self._configuration._edits
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._base
+        for path in self._configuration._edits:
+            if path[:-1] == self._path and path[-1] not in self._base:
+                yield path[-1]
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class SessionConfiguration(_ConfigurationView):
+    """Configuration of a session: a shared base with the session's edits on top.
+
+    Edits are kept by their path of keys, so an unchanged session holds an
+    empty dict and a lookup is one dict access per table level. `key` is a
+    stable digest of the effective configuration, for keying caches by it.
+    """
+
+    __slots__ = ("base", "_edits", "_key")
+
+    def __init__(self, base: BaseConfiguration) -> None:
+        super().__init__(self, (), base)
+        self.base = base
+        self._edits: dict[tuple[str, ...], Any] = {}
+        self._key: str | None = base.key
+
+    def rebase(self, base: BaseConfiguration) -> None:
+        """Move the edits onto a new version of the base configuration.
+
+        Edits of settings that no longer exist or now are the default are dropped.
+        """
+        if base is self.base:
+            return
+        self.base = self._base = base
+        for path in list(self._edits):
+            if self._base_value(path) in (None, self._edits[path]):
+                del self._edits[path]
+        self._key = None
+
+    def _lookup(self, path: tuple[str, ...], base_value: Any) -> Any:
+        if path in self._edits:
+            return self._edits[path]
+        if isinstance(base_value, Mapping):
+            return _ConfigurationView(self, path, base_value)
+        # NOTE: TOML has no null, so None means the setting does not exist
+        if base_value is None:
+            raise KeyError(path[-1])
+        return base_value
+
+    def _base_value(self, path: tuple[str, ...]) -> Any:
+        value = self.base
+        for key in path:
+            if not isinstance(value, Mapping) or key not in value:
+                return None
+            value = value[key]
+        return value
+
+    def set(self, path: tuple[str, ...], value: Any) -> None:
+        value = freeze(value)
+        if isinstance(value, Mapping):
+            raise TypeError(f"Only settings can be changed, {path} is a table")
+        # NOTE: Setting a value back to its default drops the edit
+        if value == self._base_value(path):
+            if path not in self._edits:
+                return
+            del self._edits[path]
+        else:
+            self._edits[path] = value
+        self._key = None
+
+    @property
+    def edits(self) -> Mapping[tuple[str, ...], Any]:
+        return MappingProxyType(self._edits)
+
+    @property
+    def key(self) -> str:
+        if self._key is None:
+            self._key = (
+                self.base.key
+                if not self._edits
+                else _digest(
+                    [
+                        self.base.key,
+                        sorted((list(k), v) for k, v in self._edits.items()),
+                    ]
+                )
+            )
+        return self._key
+
+
+class ConfigService:
+    """Serves the latest valid version of the config file.
+
+    Once started, the file is polled by modification time every
+    `poll_interval` seconds and only parsed when it changed. A version
+    failing validation against the current one is rejected and the current
+    one stays in use. Subscribers are called with every new version from the
+    polling thread.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.poll_interval = 0.0
+        self._stat = self._file_stat()
+        self._current = BaseConfiguration.load(path)
+        self._subscribers: list[Callable[[BaseConfiguration], None]] = []
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._loop, name="config-reloader", daemon=True
+        )
+
+    @property
+    def current(self) -> BaseConfiguration:
+        return self._current
+
+    def start(self, poll_interval: float) -> None:
+        self.poll_interval = poll_interval
+        if poll_interval > 0:
+            self._thread.start()
+
+    def subscribe(self, callback: Callable[[BaseConfiguration], None]) -> None:
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def _file_stat(self) -> tuple[int, int, int] | None:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def reload(self) -> bool:
+        """Load the file if it changed, return whether a new version is in use."""
+        stat = self._file_stat()
+        if stat is None or stat == self._stat:
+            return False
+        self._stat = stat
+        current = self._current
+        try:
+            new = BaseConfiguration.load(self.path, current.version + 1)
+        except (OSError, toml.TomlDecodeError) as e:
+            logger.error(
+                f"Could not load {self.path}, keeping version {current.version}: {e!s}"
+            )
+            return False
+        if new.key == current.key:
+            return False
+        if problems := validate_configuration(new, current):
+            logger.error(
+                f"Rejected {self.path}, keeping version {current.version}: "
+                + "; ".join(problems)
+            )
+            return False
+
+        with self._lock:
+            self._current = new
+            subscribers = list(self._subscribers)
+        logger.info(f"Loaded version {new.version} of {self.path}")
+        if changed := [
+            section
+            for section in RESTART_SECTIONS
+            if new.get(section) != current.get(section)
+        ]:
+            logger.warning(
+                f"Changes to [{'], ['.join(changed)}] take effect after a restart"
+            )
+        for callback in subscribers:
+            try:
+                callback(new)
+            except Exception as e:
+                logger.error(f"Configuration subscriber failed: {e!s}", exc_info=True)
+        return True
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Configuration reload failed: {e!s}", exc_info=True)
+
+
+@st.cache_resource
+def get_config_service() -> ConfigService:
+    service = ConfigService(CONFIG_PATH)
+    service.start(service.current["config"]["poll-interval"])
+    return service
+
+
+def get_base_configuration() -> BaseConfiguration:
+    """Return the current version of config.toml."""
+    return get_config_service().current
@@ -2,8 +2,8 @@ import streamlit as st
 
 
 def configuration_callback(table: str, key: str, value: str):
-    st.session_state.configuration[st.session_state.mode_select][table][key] = (
-        st.session_state[value]
+    st.session_state.configuration.set(
+        (st.session_state.mode_select, table, key), st.session_state[value]
     )
 
 
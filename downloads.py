@@ -0,0 +1,53 @@
+import secrets
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler
+
+import streamlit as st
+
+from config_store import get_base_configuration
+from sidecar import get_sidecar, serve_file
+
+DOWNLOADS_ROUTE = "/downloads/"
+
+
+class DownloadRegistry:
+    """Files registered for download through the sidecar server.
+
+    Each file gets an unguessable token once per run; the download link is
+    `/downloads/<token>/<filename>` and expires after `ttl` seconds.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._files: dict[str, tuple[str, str, str, float]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, path: str, filename: str, content_type: str) -> str:
+        token = secrets.token_urlsafe(24)
+        with self._lock:
+            now = time.time()
+            for expired in [
+                t for t, (*_, expires_at) in self._files.items() if expires_at < now
+            ]:
+                del self._files[expired]
+            self._files[token] = (path, filename, content_type, now + self.ttl)
+        return get_sidecar().url_for(f"{DOWNLOADS_ROUTE}{token}/{filename}")
+
+    def handle(self, request: BaseHTTPRequestHandler, path: str) -> None:
+        token = path.split("/", 1)[0]
+        with self._lock:
+            entry = self._files.get(token)
+        if entry is None or entry[3] < time.time():
+            request.send_error(HTTPStatus.NOT_FOUND)
+            return
+        file_path, filename, content_type, _ = entry
+        serve_file(request, file_path, filename, content_type)
+
+
+@st.cache_resource
+def get_download_registry() -> DownloadRegistry:
+    registry = DownloadRegistry(ttl=get_base_configuration()["sidecar"]["download-ttl"])
+    get_sidecar().add_route(DOWNLOADS_ROUTE, registry.handle)
+    return registry
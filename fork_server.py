@@ -0,0 +1,325 @@
+"""Warm executor forking osa-tool runs from a process with osa_tool preloaded.
+
+The server side runs as `python fork_server.py LISTENER_FD SCRIPT` and only
+imports the standard library besides the preloaded script, so neither the
+server nor the runs forked from it carry any of the app's state.
+"""
+
+import asyncio
+import importlib.metadata
+import json
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import traceback
+import uuid
+from typing import Callable, NoReturn
+
+MAX_REQUEST_SIZE = 1024 * 1024
+
+
+class ForkServerError(Exception):
+    """Raised when a run cannot be started through the fork server."""
+
+
+class ForkedProcess:
+    """A run forked by the fork server.
+
+    Offers the parts of `asyncio.subprocess.Process` that `run_osa_tool` uses.
+    """
+
+    def __init__(
+        self,
+        pid: int,
+        stdout: asyncio.StreamReader,
+        stderr: asyncio.StreamReader,
+        connection: socket.socket,
+    ) -> None:
+        self.pid = pid
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode: int | None = None
+        self._connection = connection
+
+    async def wait(self) -> int:
+        if self.returncode is None:
+            data = await asyncio.get_running_loop().sock_recv(self._connection, 64)
+            self._connection.close()
+            if data:
+                self.returncode = int(data)
+            else:
+                # NOTE: The exit status is lost with the fork server, make sure
+                # the orphaned run does not go on unobserved
+                try:
+                    os.killpg(self.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                self.returncode = -signal.SIGKILL
+        return self.returncode
+
+
+async def _open_pipe_reader(fd: int) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader()
+    await asyncio.get_running_loop().connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb", 0)
+    )
+    return reader
+
+
+class ForkServer:
+    """Long-lived process importing a console script's entry point once.
+
+    Runs are forked from it instead of started as new processes, skipping
+    interpreter startup and the import of osa_tool and its dependencies.
+    Each run gets its own session, working directory, environment and
+    stdout/stderr pipes, so it is sandboxed and read like a subprocess.
+    Environment variables osa_tool only reads at import time keep the values
+    of `env` the server was started with.
+    """
+
+    def __init__(self, script: str, env: dict[str, str], start_timeout: float) -> None:
+        self.script = script
+        self.env = env
+        self.start_timeout = start_timeout
+        self._address = f"\0osa-fork-server-{uuid.uuid4().hex}"
+        self._process: subprocess.Popen | None = None
+        self._ready = False
+        self._lock = threading.Lock()
+        self._ready_lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the server in the background unless it is running."""
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                return
+            with socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET) as listener:
+                listener.bind(self._address)
+                listener.listen(64)
+                # NOTE: The server exits once its stdin, kept open here, is closed
+                self._process = subprocess.Popen(
+                    [
+                        sys.executable,
+                        os.path.abspath(__file__),
+                        str(listener.fileno()),
+                        self.script,
+                    ],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    env=self.env,
+                    pass_fds=(listener.fileno(),),
+                )
+            self._ready = False
+
+    def _wait_ready(self) -> None:
+        self.start()
+        # NOTE: Only callers waiting for the server to start are held up here,
+        # start() and close() only need the process lock briefly
+        with self._ready_lock:
+            with self._lock:
+                process = self._process
+                if self._ready:
+                    return
+            if process is None:
+                raise ForkServerError(f"Fork server for {self.script} was stopped")
+            readable, _, _ = select.select([process.stdout], [], [], self.start_timeout)
+            ready = bool(readable) and process.stdout.readline().strip() == b"ready"
+            with self._lock:
+                if not ready:
+                    process.kill()
+                    process.wait()
+                    raise ForkServerError(
+                        f"Fork server for {self.script} did not start"
+                    )
+                self._ready = process is self._process
+
+    def _fork(
+        self, cmd: list[str], env: dict[str, str]
+    ) -> tuple[int, socket.socket, int, int]:
+        """Ask the server to fork a run.
+
+        Returns its pid, the connection reporting its exit code and the read
+        ends of its stdout and stderr pipes.
+        """
+        self._wait_ready()
+        stdout_read, stdout_write = os.pipe()
+        stderr_read, stderr_write = os.pipe()
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            connection.settimeout(self.start_timeout)
+            connection.connect(self._address)
+            request = {"argv": cmd, "env": env, "cwd": os.getcwd()}
+            socket.send_fds(
+                connection, [json.dumps(request).encode()], [stdout_write, stderr_write]
+            )
+            pid = int(connection.recv(64))
+        except (OSError, ValueError) as e:
+            connection.close()
+            os.close(stdout_read)
+            os.close(stderr_read)
+            raise ForkServerError(f"Could not fork {self.script}: {e!s}") from e
+        finally:
+            os.close(stdout_write)
+            os.close(stderr_write)
+        connection.setblocking(False)
+        return pid, connection, stdout_read, stderr_read
+
+    async def spawn(self, cmd: list[str], env: dict[str, str]) -> ForkedProcess:
+        """Fork a run of `cmd` with the given environment."""
+        # NOTE: Starting the server and the handshake block, keep them off the
+        # event loop that drains the output of the worker's other runs
+        pid, connection, stdout_read, stderr_read = await asyncio.to_thread(
+            self._fork, cmd, env
+        )
+        return ForkedProcess(
+            pid,
+            await _open_pipe_reader(stdout_read),
+            await _open_pipe_reader(stderr_read),
+            connection,
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._process is not None:
+                self._process.stdin.close()
+                self._process.wait()
+                self._process = None
+
+
+def load_entry_point(script: str) -> Callable[[], object]:
+    (entry_point,) = importlib.metadata.entry_points(
+        group="console_scripts", name=script
+    )
+    return entry_point.load()
+
+
+def _exit_code(e: SystemExit) -> int:
+    if e.code is None:
+        return 0
+    if isinstance(e.code, int):
+        return e.code
+    print(e.code, file=sys.stderr)
+    return 1
+
+
+def _run_child(
+    main: Callable[[], object],
+    request: dict,
+    stdout_fd: int,
+    stderr_fd: int,
+    ready_fd: int,
+) -> NoReturn:
+    """Run the entry point in a forked child, mimicking a fresh console script.
+
+    A byte is written to `ready_fd` once the child leads its own process group.
+    """
+    code = 1
+    try:
+        os.setsid()
+        os.write(ready_fd, b"\0")
+        os.close(ready_fd)
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(stdout_fd, 1)
+        os.dup2(stderr_fd, 2)
+        for fd in (devnull, stdout_fd, stderr_fd):
+            os.close(fd)
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+        sys.argv = request["argv"]
+        try:
+            main()
+            code = 0
+        except SystemExit as e:
+            code = _exit_code(e)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except Exception:
+                pass
+        # NOTE: Skip atexit handlers and finalizers inherited from the server
+        os._exit(code)
+
+
+def serve(listener: socket.socket, main: Callable[[], object]) -> None:
+    """Fork a child per connection and report its pid and exit code back.
+
+    Stdin is a pipe from the app, its end means the app is gone.
+    """
+    # NOTE: Children are reaped through pidfds, so they can be waited for
+    # selectively from the same single-threaded loop
+    children: dict[int, tuple[int, socket.socket]] = {}
+    stdin_fd = sys.stdin.fileno()
+    while True:
+        readable, _, _ = select.select([stdin_fd, listener, *children], [], [])
+        for ready in readable:
+            if ready == stdin_fd:
+                if not os.read(stdin_fd, 1024):
+                    return
+            elif ready is listener:
+                connection, _ = listener.accept()
+                try:
+                    connection.settimeout(5)
+                    message, fds, _, _ = socket.recv_fds(
+                        connection, MAX_REQUEST_SIZE, 2
+                    )
+                    if len(fds) != 2:
+                        raise ValueError("stdout and stderr were not passed")
+                    request = json.loads(message)
+                except (OSError, ValueError) as e:
+                    print(f"Fork server request failed: {e!s}", file=sys.stderr)
+                    connection.close()
+                    continue
+                ready_read, ready_write = os.pipe()
+                pid = os.fork()
+                if pid == 0:
+                    listener.close()
+                    for pidfd, (_, other) in children.items():
+                        os.close(pidfd)
+                        other.close()
+                    connection.close()
+                    os.close(ready_read)
+                    _run_child(main, request, *fds, ready_write)
+                for fd in (*fds, ready_write):
+                    os.close(fd)
+                # NOTE: Report the pid only once the child called setsid(), so
+                # the app can signal its process group right away; a child that
+                # died before that closes the pipe instead
+                os.read(ready_read, 1)
+                os.close(ready_read)
+                children[os.pidfd_open(pid)] = (pid, connection)
+                try:
+                    connection.sendall(f"{pid}\n".encode())
+                except OSError:
+                    pass
+            else:
+                pid, connection = children.pop(ready)
+                os.close(ready)
+                _, status = os.waitpid(pid, 0)
+                try:
+                    connection.sendall(
+                        f"{os.waitstatus_to_exitcode(status)}\n".encode()
+                    )
+                except OSError:
+                    pass
+                connection.close()
+
+
+def _server_main() -> None:
+    listener = socket.socket(fileno=int(sys.argv[1]))
+    entry_point = load_entry_point(sys.argv[2])
+    print("ready", flush=True)
+    serve(listener, entry_point)
+
+
+if __name__ == "__main__":
+    _server_main()
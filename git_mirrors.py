@@ -0,0 +1,208 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from logger_config import logger
+
+
+@contextmanager
+def _flock(path: str, operation: int) -> Iterator[bool]:
+    """Hold a flock on `path`, yield False if a non-blocking lock failed."""
+    with open(path, "a") as file:
+        try:
+            fcntl.flock(file, operation)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def _dir_size(path: str) -> int:
+    size = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.lstat(os.path.join(root, filename)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def git_url_rewrite_env(
+    mirror_path: str, repo_url: str, env: dict[str, str] | None = None
+) -> dict[str, str]:
+    """Build GIT_CONFIG_* variables that redirect fetches of `repo_url` to a mirror.
+
+    osa-tool always clones `<repository>.git`, so only that URL is rewritten;
+    the bare URL would also prefix-match unrelated repositories. Pushes keep
+    going to the original URL, since a `pushInsteadOf` rule takes precedence
+    over `insteadOf` for push URLs.
+    """
+    url = repo_url.rstrip("/").removesuffix(".git") + ".git"
+    count = int((env or {}).get("GIT_CONFIG_COUNT", 0))
+    rewrite_env = {}
+    for key, value in (
+        (f"url.{mirror_path}.insteadOf", url),
+        (f"url.{url}.pushInsteadOf", url),
+    ):
+        rewrite_env[f"GIT_CONFIG_KEY_{count}"] = key
+        rewrite_env[f"GIT_CONFIG_VALUE_{count}"] = value
+        count += 1
+    rewrite_env["GIT_CONFIG_COUNT"] = str(count)
+    return rewrite_env
+
+
+class GitMirrorCache:
+    """Shared bare mirrors of repositories processed by osa-tool.
+
+    Each repository has a `<name>.git` bare mirror that is fetched
+    incrementally, a `<name>.lock` serialising its creation and updates, and
+    a `<name>.use` file that runs hold a shared lock on while they clone from
+    the mirror. Least recently used mirrors are evicted above `max_size`
+    bytes, skipping mirrors that are in use.
+    """
+
+    def __init__(
+        self, path: str, max_size: int, refresh_interval: float, timeout: float
+    ) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        os.makedirs(path, exist_ok=True)
+
+    def _name(self, repo_url: str) -> str:
+        repo_url = repo_url.rstrip("/").removesuffix(".git")
+        slug = re.sub(r"[^A-Za-z0-9_.-]", "_", repo_url.rsplit("/", 1)[-1])[:40]
+        return f"{slug}-{hashlib.sha1(repo_url.encode()).hexdigest()[:16]}"
+
+    def _git(self, *args: str, env: dict[str, str] | None = None) -> None:
+        subprocess.run(
+            ["git", *args],
+            check=True,
+            capture_output=True,
+            timeout=self.timeout,
+            env={**(env or os.environ), "GIT_TERMINAL_PROMPT": "0"},
+        )
+
+    def _read_meta(self, name: str) -> dict:
+        try:
+            with open(os.path.join(self.path, f"{name}.meta")) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, name: str, meta: dict) -> None:
+        meta_path = os.path.join(self.path, f"{name}.meta")
+        with open(f"{meta_path}.tmp", "w") as file:
+            json.dump(meta, file)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def update(self, repo_url: str, env: dict[str, str] | None = None) -> str:
+        """Create or incrementally fetch the mirror and return its path."""
+        name = self._name(repo_url)
+        mirror_path = os.path.join(self.path, f"{name}.git")
+        with _flock(os.path.join(self.path, f"{name}.lock"), fcntl.LOCK_EX):
+            meta = self._read_meta(name)
+            if not os.path.isdir(mirror_path):
+                staging = f"{mirror_path}.staging"
+                shutil.rmtree(staging, ignore_errors=True)
+                logger.info(f"Creating git mirror of {repo_url}")
+                try:
+                    self._git("clone", "--bare", "--quiet", repo_url, staging, env=env)
+                    for refspec in (
+                        "+refs/heads/*:refs/heads/*",
+                        "+refs/tags/*:refs/tags/*",
+                    ):
+                        self._git(
+                            "-C",
+                            staging,
+                            "config",
+                            "--add",
+                            "remote.origin.fetch",
+                            refspec,
+                        )
+                    # NOTE: Never repack behind the back of a run cloning from the mirror
+                    self._git("-C", staging, "config", "gc.auto", "0")
+                except (OSError, subprocess.SubprocessError):
+                    shutil.rmtree(staging, ignore_errors=True)
+                    raise
+                os.rename(staging, mirror_path)
+                meta = {"url": repo_url, "fetched_at": time.time()}
+            elif time.time() - meta.get("fetched_at", 0) >= self.refresh_interval:
+                logger.debug(f"Fetching git mirror of {repo_url}")
+                self._git(
+                    "-C", mirror_path, "fetch", "--prune", "--quiet", "origin", env=env
+                )
+                meta["fetched_at"] = time.time()
+            meta["size"] = _dir_size(mirror_path)
+            meta["used_at"] = time.time()
+            self._write_meta(name, meta)
+        return mirror_path
+
+    @contextmanager
+    def use(
+        self, repo_url: str, env: dict[str, str] | None = None
+    ) -> Iterator[dict[str, str]]:
+        """Update the mirror and yield env redirecting clones of `repo_url` to it.
+
+        Yields an empty env if the mirror could not be created, in which case
+        osa-tool clones from the remote as usual.
+        """
+        name = self._name(repo_url)
+        try:
+            with _flock(os.path.join(self.path, f"{name}.use"), fcntl.LOCK_SH):
+                try:
+                    mirror_path = self.update(repo_url, env)
+                except (OSError, subprocess.SubprocessError) as e:
+                    logger.warning(f"Could not mirror {repo_url}: {e!s}")
+                    yield {}
+                    return
+                yield git_url_rewrite_env(mirror_path, repo_url, env)
+        finally:
+            # NOTE: Eviction must never fail the run that used the mirror
+            try:
+                self.evict()
+            except OSError as e:
+                logger.warning(f"Could not evict git mirrors: {e!s}")
+
+    def evict(self) -> None:
+        """Remove least recently used mirrors that are not in use above `max_size`."""
+        mirrors = []
+        for filename in os.listdir(self.path):
+            if filename.endswith(".meta"):
+                name = filename.removesuffix(".meta")
+                meta = self._read_meta(name)
+                mirrors.append((meta.get("used_at", 0), meta.get("size", 0), name))
+        mirrors.sort()
+        total_size = sum(size for _, size, _ in mirrors)
+        for _, size, name in mirrors:
+            if total_size <= self.max_size:
+                break
+            with _flock(
+                os.path.join(self.path, f"{name}.use"), fcntl.LOCK_EX | fcntl.LOCK_NB
+            ) as locked:
+                if not locked:
+                    continue
+                with _flock(os.path.join(self.path, f"{name}.lock"), fcntl.LOCK_EX):
+                    shutil.rmtree(
+                        os.path.join(self.path, f"{name}.git"), ignore_errors=True
+                    )
+                    try:
+                        os.remove(os.path.join(self.path, f"{name}.meta"))
+                    except FileNotFoundError:
+                        # NOTE: Another worker evicted the mirror first
+                        total_size -= size
+                        continue
+            total_size -= size
+            logger.info(f"Evicted git mirror {name}")
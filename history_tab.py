@@ -0,0 +1,197 @@
+import datetime
+import math
+import os
+
+import streamlit as st
+
+from downloads import get_download_registry
+from jobs import JOB_FINISHED, get_job_queue
+from main_tab import reattach_osa_job
+from run_history import RunRecord, get_run_history
+
+ALL_REPOSITORIES = "All repositories"
+
+
+def _reset_history_page() -> None:
+    st.session_state.history_page = 0
+
+
+def _change_history_page(step: int) -> None:
+    st.session_state.history_page += step
+
+
+def _format_time(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M")
+
+
+def _download_urls(run: RunRecord) -> tuple[list[str], str | None]:
+    """Return download links of the run's reports and log, registered once per session."""
+    # NOTE: Files of past runs are served from the history, never rerun
+    urls = st.session_state.setdefault("history_urls", {})
+    if run.id not in urls:
+        download_registry = get_download_registry()
+        urls[run.id] = (
+            [
+                download_registry.register(path, filename, "application/pdf")
+                for path, filename in zip(run.report_paths, run.report_filenames)
+                if os.path.exists(path)
+            ],
+            run.log_path
+            and os.path.exists(run.log_path)
+            and download_registry.register(
+                run.log_path, os.path.basename(run.log_path), "text/plain"
+            )
+            or None,
+        )
+    return urls[run.id]
+
+
+def render_active_run(run: RunRecord) -> None:
+    with st.expander(
+        f"{_format_time(run.submitted_at)} · {run.repo_url} · {run.mode}",
+        icon=":material/progress_activity:",
+    ):
+        left, right = st.columns([0.8, 0.2], vertical_alignment="center")
+        with left:
+            st.info(
+                "Queued" if run.started_at is None else "In progress",
+                icon=":material/hourglass_empty:",
+            )
+        with right:
+            job = get_job_queue().get(run.id)
+            st.button(
+                "Show Progress",
+                key=f"history-reattach-{run.id}",
+                icon=":material/visibility:",
+                use_container_width=True,
+                disabled=job is None
+                or job.batch_id is not None
+                or st.session_state.get("job_id") == run.id,
+                help="Follow the run in the Home tab",
+                on_click=reattach_osa_job,
+                args=(run.id,),
+            )
+
+
+def render_history_run(run: RunRecord) -> None:
+    if not run.done:
+        render_active_run(run)
+        return
+    succeeded = run.status == JOB_FINISHED and run.exit_code == 0
+    with st.expander(
+        f"{_format_time(run.submitted_at)} · {run.repo_url} · {run.mode}",
+        icon=":material/check_circle:" if succeeded else ":material/error:",
+    ):
+        left, right = st.columns([0.8, 0.2], vertical_alignment="center")
+        with left:
+            if succeeded:
+                st.success(run.message, icon=":material/check_circle:")
+            else:
+                st.error(run.message or run.status, icon=":material/error:")
+        report_urls, log_url = _download_urls(run)
+        with right:
+            for url in report_urls:
+                st.link_button(
+                    "Download Report",
+                    url=url,
+                    icon=":material/download:",
+                    use_container_width=True,
+                )
+            if log_url:
+                st.link_button(
+                    "Download Log",
+                    url=log_url,
+                    icon=":material/download:",
+                    use_container_width=True,
+                )
+            if not report_urls:
+                with st.container(border=True):
+                    st.markdown(
+                        '<p style="text-align: center;">No PDF report.</p>',
+                        unsafe_allow_html=True,
+                    )
+
+        details = [f"Branch: `{run.branch or 'default'}`"]
+        if run.started_at is not None:
+            details.append(f"Waited {run.started_at - run.submitted_at:.0f}s")
+        if run.duration is not None:
+            details.append(f"Ran {run.duration:.0f}s")
+        if run.config_version is not None:
+            details.append(f"Config version {run.config_version}")
+        if run.cached:
+            details.append("Cached result")
+        st.caption(" · ".join(details))
+        if run.phase_durations:
+            st.caption(
+                " · ".join(
+                    f"{phase} {seconds:.0f}s"
+                    for phase, seconds in run.phase_durations.items()
+                )
+            )
+        if run.pr_link:
+            st.markdown(f"Pull request: {run.pr_link}")
+        if run.about_section:
+            st.markdown("**About section**")
+            st.write(run.about_section)
+
+
+def render_history_tab() -> None:
+    _, center, _ = st.columns([0.1, 0.8, 0.1])
+    with center:
+        history = get_run_history()
+        if history is None:
+            st.info("Run history is disabled on this server.", icon=":material/info:")
+            return
+        user_id = st.user.get("email") or st.user.get("name", "Username")
+        if "history_page" not in st.session_state:
+            st.session_state.history_page = 0
+
+        repository = st.selectbox(
+            "Repository",
+            [ALL_REPOSITORIES, *history.repositories(user_id)],
+            key="history_repo",
+            on_change=_reset_history_page,
+        )
+        repo_url = None if repository == ALL_REPOSITORIES else repository
+        total = history.count(user_id, repo_url)
+        if total == 0:
+            st.markdown(
+                '<p style="text-align: center;">No runs yet.</p>',
+                unsafe_allow_html=True,
+            )
+            return
+
+        page_size = st.session_state.configuration["history"]["page-size"]
+        pages = math.ceil(total / page_size)
+        page = st.session_state.history_page = min(
+            st.session_state.history_page, pages - 1
+        )
+        # NOTE: Only the runs of the visible page are read from the database
+        for run in history.page(user_id, page, page_size, repo_url):
+            render_history_run(run)
+
+        left, middle, right = st.columns([0.2, 0.6, 0.2], vertical_alignment="center")
+        with left:
+            st.button(
+                "Newer",
+                icon=":material/chevron_left:",
+                use_container_width=True,
+                disabled=page == 0,
+                on_click=_change_history_page,
+                args=(-1,),
+            )
+        with middle:
+            st.markdown(
+                f'<p style="text-align: center;">Page {page + 1} of {pages} '
+                f"({total} runs)</p>",
+                unsafe_allow_html=True,
+            )
+        with right:
+            st.button(
+                "Older",
+                icon=":material/chevron_right:",
+                use_container_width=True,
+                disabled=page == pages - 1,
+                on_click=_change_history_page,
+                args=(1,),
+            )
@@ -0,0 +1,139 @@
+import os
+import shutil
+import threading
+import time
+from typing import Callable
+
+import streamlit as st
+
+from config_store import get_base_configuration
+from jobs import get_job_queue
+from logger_config import logger
+
+
+def _tree_size(path: str) -> int:
+    if not os.path.isdir(path):
+        return os.lstat(path).st_size
+    size = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.lstat(os.path.join(root, filename)).st_size
+            except OSError:
+                pass
+    return size
+
+
+class TmpJanitor:
+    """Reclaims space of session and run directories under `paths.tmp`.
+
+    Every top-level entry of `root` (a session directory created by
+    `streamlit_app.main`) is removed once it has not been accessed for `ttl`
+    seconds, and least recently accessed entries are removed while the total
+    size exceeds `quota` bytes. Directories used by queued or running jobs
+    and the `exclude` entries are never touched.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        ttl: float,
+        quota: int,
+        interval: float,
+        is_active: Callable[[str], bool],
+        exclude: tuple[str, ...] = (),
+    ) -> None:
+        self.root = root
+        self.ttl = ttl
+        self.quota = quota
+        self.interval = interval
+        self.is_active = is_active
+        self.exclude = exclude
+        self.reclaimed_total = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._loop, name="tmp-janitor", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    @staticmethod
+    def touch(path: str) -> None:
+        """Record an access to a session directory."""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _remove(self, path: str, size: int, reason: str) -> int:
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"Could not remove {path}: {e!s}")
+            return 0
+        logger.info(f"Removed {path} ({reason}, {size} bytes)")
+        return size
+
+    def sweep(self) -> int:
+        """Remove expired and over-quota entries and return the reclaimed bytes."""
+        with self._lock:
+            now = time.time()
+            entries = []
+            for name in os.listdir(self.root):
+                if name in self.exclude:
+                    continue
+                path = os.path.join(self.root, name)
+                try:
+                    entries.append((os.stat(path).st_mtime, _tree_size(path), path))
+                except OSError:
+                    continue
+            entries.sort()
+
+            reclaimed = 0
+            total_size = sum(size for _, size, _ in entries)
+            for accessed_at, size, path in entries:
+                expired = now - accessed_at > self.ttl
+                if not expired and total_size <= self.quota:
+                    break
+                if self.is_active(path):
+                    continue
+                removed = self._remove(
+                    path, size, "expired" if expired else "over quota"
+                )
+                reclaimed += removed
+                total_size -= removed
+
+            self.reclaimed_total += reclaimed
+        if reclaimed:
+            logger.info(
+                f"Reclaimed {reclaimed} bytes in {self.root}, {total_size} bytes in use"
+            )
+        return reclaimed
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Temp directory sweep failed: {e!s}", exc_info=True)
+            time.sleep(self.interval)
+
+
+@st.cache_resource
+def get_janitor() -> TmpJanitor:
+    config = get_base_configuration()
+    janitor_config = config["janitor"]
+    janitor = TmpJanitor(
+        config["paths"]["tmp"],
+        ttl=janitor_config["ttl"] * 3600,
+        quota=janitor_config["quota"] * 1024 * 1024,
+        interval=janitor_config["interval"],
+        is_active=get_job_queue().is_dir_active,
+        exclude=("git-mirrors",),
+    )
+    janitor.start()
+    return janitor
@@ -0,0 +1,563 @@
+import asyncio
+import contextlib
+import functools
+import os
+import shutil
+import signal
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+import streamlit as st
+
+from admission import AdmissionController, JobRejected
+from config_store import get_base_configuration
+from fork_server import ForkServer
+from git_mirrors import GitMirrorCache
+from log_store import RunLog
+from log_view import LogView
+from logger_config import log_context, logger
+from metrics import (
+    QUEUE_DEPTH,
+    RUNS_ACTIVE,
+    SUBPROCESSES_ACTIVE,
+    observe_run,
+)
+from phases import PhaseTimeline
+from result_cache import ResultCache, resolve_head_sha, result_cache_key
+from run_history import RunHistory, get_run_history
+from sandbox import (
+    REASON_CANCELLED,
+    REASON_MESSAGES,
+    ExecutionProfile,
+    Sandbox,
+    is_running,
+)
+from utils import OSA_ENV, run_osa_tool
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_FINISHED = "finished"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+JOB_DONE_STATUSES = (JOB_FINISHED, JOB_FAILED, JOB_CANCELLED)
+
+
+class JobQueueFull(JobRejected):
+    """Raised when the job queue cannot accept more runs."""
+
+
+@dataclass
+class Job:
+    """A single osa-tool run submitted from a session."""
+
+    cmd: list[str]
+    env: dict[str, str]
+    user: str
+    user_id: str
+    repo_url: str
+    mode: str
+    tmpdirname: str
+    run_log: RunLog
+    output_dir: str = ""
+    branch: str = ""
+    use_cache: bool = False
+    batch_id: str | None = None
+    config_version: int | None = None
+    profile: ExecutionProfile = field(default_factory=ExecutionProfile)
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = JOB_QUEUED
+    submitted_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    log_view: LogView = field(default_factory=LogView)
+    timeline: PhaseTimeline = field(default_factory=PhaseTimeline)
+    output_report_paths: list[str] = field(default_factory=list)
+    output_report_filenames: list[str] = field(default_factory=list)
+    output_about_section: str | None = None
+    output_exit_code: int | None = None
+    output_message: str = ""
+    pr_link: str | None = None
+    cached: bool = False
+    termination_reason: str | None = None
+    output_lines: int = 0
+    peak_rss: int | None = None
+    cpu_seconds: float | None = None
+    cancel_requested: bool = False
+    sandbox: Sandbox | None = field(default=None, repr=False)
+    error: str | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in JOB_DONE_STATUSES
+
+    def new_attempt(self) -> "Job":
+        """Return a new queued job running the same command in the same directory."""
+        job_id = uuid.uuid4().hex
+        return Job(
+            id=job_id,
+            cmd=list(self.cmd),
+            env=dict(self.env),
+            user=self.user,
+            user_id=self.user_id,
+            repo_url=self.repo_url,
+            mode=self.mode,
+            tmpdirname=self.tmpdirname,
+            output_dir=self.output_dir,
+            branch=self.branch,
+            use_cache=self.use_cache,
+            batch_id=self.batch_id,
+            config_version=self.config_version,
+            profile=self.profile,
+            run_log=RunLog(
+                os.path.join(self.tmpdirname, f"osa_run_{job_id}.log"),
+                memory_limit=self.run_log.memory_limit,
+                chunk_size=self.run_log.chunk_size,
+                flush_interval=self.run_log.flush_interval,
+            ),
+            log_view=LogView(
+                tail_lines=self.log_view.tail_lines,
+                flush_interval=self.log_view.flush_interval,
+                flush_lines=self.log_view.flush_lines,
+            ),
+        )
+
+
+def default_worker_count(worker_memory_mb: int) -> int:
+    """Size the worker pool by host CPU cores and physical memory."""
+    cpu_count = os.cpu_count() or 1
+    try:
+        memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return cpu_count
+    return max(1, min(cpu_count, memory // (worker_memory_mb * 1024 * 1024)))
+
+
+class JobQueue:
+    """Bounded FIFO of osa-tool runs served by a fixed pool of worker threads.
+
+    Workers take the oldest pending job the admission controller allows to
+    start, so a user's extra runs wait without blocking other users.
+    With a run history, jobs are recorded from submission on, and osa-tool
+    runs left behind by an earlier app process are stopped on start.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        queue_size: int,
+        retention: float,
+        poll_interval: float,
+        output_buffer: int,
+        stderr_tail: int,
+        cgroup_root: str = "",
+        sample_interval: float = 1.0,
+        fork_server: ForkServer | None = None,
+        result_cache: ResultCache | None = None,
+        git_mirrors: GitMirrorCache | None = None,
+        admission: AdmissionController | None = None,
+        history: RunHistory | None = None,
+    ) -> None:
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self.output_buffer = output_buffer
+        self.stderr_tail = stderr_tail
+        self.cgroup_root = cgroup_root
+        self.sample_interval = sample_interval
+        self.fork_server = fork_server
+        self.result_cache = result_cache
+        self.git_mirrors = git_mirrors
+        self.admission = admission
+        self.history = history
+        self._pending: deque[Job] = deque()
+        self._jobs: dict[str, Job] = {}
+        self._condition = threading.Condition()
+        if history is not None:
+            self._reap_orphans()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"osa-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, job: Job) -> Job:
+        with self._condition:
+            self._prune()
+            if len(self._pending) >= self.queue_size:
+                raise JobQueueFull(
+                    f"The server is busy, {len(self._pending)} runs are already "
+                    "waiting. Please try again later."
+                )
+            # NOTE: Batches are admitted as a whole and submit their runs themselves
+            if self.admission is not None and job.batch_id is None:
+                self.admission.admit(
+                    job.user_id,
+                    sum(
+                        1
+                        for other in self._jobs.values()
+                        if other.user_id == job.user_id
+                        and other.batch_id is None
+                        and not other.done
+                    ),
+                )
+            if self.history is not None:
+                self.history.submitted(job)
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._condition.notify_all()
+        logger.info(
+            f"Queued job {job.id} for {job.repo_url} "
+            f"({job.mode}, config version {job.config_version})"
+        )
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job, return whether it was still active.
+
+        A queued job is dropped at once. A running job has its osa-tool process
+        group terminated; its worker is released as soon as the group is gone,
+        at most `kill_grace` seconds later.
+        """
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.done or job.cancel_requested:
+                return False
+            job.cancel_requested = True
+            dropped = job.status == JOB_QUEUED
+            if dropped:
+                self._pending.remove(job)
+                job.run_log.close()
+                self._finish_cancelled(job)
+                job.finished_at = time.time()
+                job.status = JOB_CANCELLED
+            elif job.sandbox is not None:
+                job.sandbox.cancel()
+        logger.info(f"Cancelled job {job.id} of {job.user_id}")
+        # NOTE: Running jobs are recorded by their worker
+        if dropped:
+            observe_run(job)
+            if self.history is not None:
+                self.history.record(job)
+        return True
+
+    def get(self, job_id: str) -> Job | None:
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def position(self, job_id: str) -> int | None:
+        """Return the 1-based queue position of a pending job."""
+        with self._condition:
+            for i, job in enumerate(self._pending):
+                if job.id == job_id:
+                    return i + 1
+        return None
+
+    def is_dir_active(self, path: str) -> bool:
+        """Check whether a queued or running job uses the directory or one inside it."""
+        path = os.path.realpath(path)
+        with self._condition:
+            return any(
+                not job.done
+                and os.path.commonpath((os.path.realpath(job.tmpdirname), path)) == path
+                for job in self._jobs.values()
+            )
+
+    def stats(self) -> dict[str, Any]:
+        with self._condition:
+            running = sum(1 for job in self._jobs.values() if job.status == JOB_RUNNING)
+            return {
+                "workers": self.workers,
+                "queued": len(self._pending),
+                "running": running,
+            }
+
+    def subprocess_count(self) -> int:
+        """Return the number of osa-tool processes currently running."""
+        with self._condition:
+            return sum(1 for job in self._jobs.values() if job.sandbox is not None)
+
+    def _prune(self) -> None:
+        deadline = time.time() - self.retention
+        for job_id in [
+            job.id
+            for job in self._jobs.values()
+            if job.done and job.finished_at and job.finished_at < deadline
+        ]:
+            del self._jobs[job_id]
+
+    def _run(self, job: Job) -> None:
+        if job.output_dir:
+            os.makedirs(job.output_dir, exist_ok=True)
+        cache_key = None
+        if job.use_cache and self.result_cache is not None:
+            if head_sha := resolve_head_sha(job.repo_url, job.branch, job.env):
+                cache_key = result_cache_key(job.repo_url, head_sha, job.cmd)
+                if self._load_cached_result(job, cache_key, head_sha):
+                    return
+
+        with (
+            self.git_mirrors.use(job.repo_url, job.env)
+            if self.git_mirrors is not None
+            else contextlib.nullcontext({})
+        ) as git_env:
+            job.env.update(git_env)
+            if job.cancel_requested:
+                return
+            asyncio.run(
+                run_osa_tool(
+                    job,
+                    output_buffer=self.output_buffer,
+                    stderr_tail=self.stderr_tail,
+                    cgroup_root=self.cgroup_root,
+                    sample_interval=self.sample_interval,
+                    fork_server=self.fork_server,
+                    on_start=(
+                        functools.partial(self.history.started, job)
+                        if self.history is not None
+                        else None
+                    ),
+                )
+            )
+
+        if (
+            cache_key is not None
+            and job.output_exit_code == 0
+            and not job.cancel_requested
+        ):
+            self.result_cache.put(
+                cache_key,
+                job.output_report_paths,
+                job.output_about_section,
+                job.output_message,
+            )
+
+    def _reap_orphans(self) -> None:
+        """Stop the osa-tool runs of app processes that are gone.
+
+        Their output can no longer be read, so every process group is asked
+        to terminate and killed after the grace period, and the runs are
+        marked as interrupted.
+        """
+        orphans = self.history.orphans()
+        sandboxes = {}
+        for run in orphans:
+            if run.process is not None and is_running(run.process):
+                sandbox = Sandbox.adopt(
+                    int(run.process.split(":")[1]), run.cgroup, ExecutionProfile()
+                )
+                sandbox.kill(signal.SIGTERM)
+                sandboxes[run.process] = sandbox
+        deadline = time.monotonic() + ExecutionProfile.kill_grace
+        while any(map(is_running, sandboxes)) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        for process, sandbox in sandboxes.items():
+            if is_running(process):
+                sandbox.kill(signal.SIGKILL)
+            sandbox.close()
+        for run in orphans:
+            self.history.interrupt(run)
+        if orphans:
+            logger.warning(
+                f"Marked {len(orphans)} runs of a previous app process as "
+                f"interrupted, stopped {len(sandboxes)} orphaned osa-tool runs"
+            )
+
+    def _load_cached_result(self, job: Job, cache_key: str, head_sha: str) -> bool:
+        meta = self.result_cache.get(cache_key, job.output_dir or job.tmpdirname)
+        if meta is None:
+            return False
+        cache_log_msg = f"Using cached result for {job.repo_url} at {head_sha}"
+        logger.info(cache_log_msg)
+        job.run_log.append(cache_log_msg)
+        job.log_view.append(cache_log_msg)
+        job.cached = True
+        job.output_report_paths = meta["report_paths"]
+        job.output_report_filenames = meta["report_filenames"]
+        job.output_about_section = meta["about_section"]
+        job.output_exit_code = 0
+        job.output_message = (
+            f"{meta['message']} *(cached result for commit `{head_sha[:12]}`)*"
+        )
+        return True
+
+    @staticmethod
+    def _finish_cancelled(job: Job) -> None:
+        job.termination_reason = REASON_CANCELLED
+        job.output_report_paths = []
+        job.output_report_filenames = []
+        job.output_about_section = None
+        job.pr_link = None
+        if job.output_exit_code is None:
+            job.output_exit_code = -1
+        job.output_message = (
+            f"**OSA tool was stopped**: {REASON_MESSAGES[REASON_CANCELLED]}"
+        )
+
+    @staticmethod
+    def _remove_partial_artifacts(job: Job) -> None:
+        """Remove the output directory of a cancelled run.
+
+        Only the run's own directory is removed, the session directory it is
+        in holds the run log and the files of other runs and batches.
+        """
+        if not job.output_dir:
+            return
+        try:
+            shutil.rmtree(job.output_dir)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(
+                f"Could not remove {job.output_dir} of cancelled job {job.id}: {e!s}"
+            )
+
+    def _next_job(self) -> Job | None:
+        running = [job for job in self._jobs.values() if job.status == JOB_RUNNING]
+        for job in self._pending:
+            # NOTE: Runs of a batch are limited by the batch parallelism instead
+            user_running = (
+                0
+                if job.batch_id is not None
+                else sum(
+                    1
+                    for other in running
+                    if other.user_id == job.user_id and other.batch_id is None
+                )
+            )
+            if self.admission is None or self.admission.can_start(
+                user_running, len(running)
+            ):
+                self._pending.remove(job)
+                return job
+        return None
+
+    def _worker(self) -> None:
+        while True:
+            with self._condition:
+                while (job := self._next_job()) is None:
+                    self._condition.wait()
+                job.status = JOB_RUNNING
+                job.started_at = time.time()
+            with log_context(
+                run_id=job.id,
+                user=job.user_id,
+                repo=job.repo_url,
+                mode=job.mode,
+                started_at=job.started_at,
+            ):
+                try:
+                    self._work(job)
+                except Exception as e:
+                    # NOTE: Bookkeeping errors must neither kill the worker
+                    # nor leave the job running forever
+                    logger.error(f"Job {job.id} failed: {e!s}", exc_info=True)
+                    if not job.done:
+                        job.error = str(e)
+                        job.run_log.close()
+                        job.finished_at = time.time()
+                        job.status = JOB_FAILED
+            with self._condition:
+                # NOTE: A finished job may unblock jobs held back by admission limits
+                self._condition.notify_all()
+
+    def _work(self, job: Job) -> None:
+        logger.info(f"Started job {job.id} on {threading.current_thread().name}")
+        if self.history is not None:
+            self.history.started(job)
+        status = JOB_FINISHED
+        try:
+            self._run(job)
+        except Exception as e:
+            status = JOB_FAILED
+            job.error = str(e)
+            logger.error(f"Job {job.id} failed: {e!s}", exc_info=True)
+        finally:
+            if job.cancel_requested:
+                status = JOB_CANCELLED
+                job.error = None
+                self._remove_partial_artifacts(job)
+                self._finish_cancelled(job)
+            job.run_log.close()
+            job.finished_at = time.time()
+            job.status = status
+        observe_run(job)
+        if self.history is not None:
+            self.history.record(job)
+        logger.info(
+            f"Job {job.id} {job.status} in {job.finished_at - job.started_at:.1f}s"
+        )
+
+
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    config = get_base_configuration()
+    jobs_config = config["jobs"]
+    workers = jobs_config["workers"] or default_worker_count(
+        jobs_config["worker-memory"]
+    )
+    logger.info(f"Starting job queue with {workers} osa-tool workers")
+
+    fork_server = None
+    if jobs_config["executor"] == "forkserver":
+        fork_server = ForkServer(
+            "osa-tool",
+            env=os.environ | OSA_ENV,
+            start_timeout=jobs_config["fork-server-timeout"],
+        )
+        # NOTE: Preload osa_tool while the app is still idle
+        fork_server.start()
+        logger.info("Starting osa-tool fork server")
+
+    result_cache = None
+    if (cache_config := config["result-cache"])["enabled"]:
+        result_cache = ResultCache(
+            cache_config["path"],
+            max_size=cache_config["max-size"] * 1024 * 1024,
+            max_entries=cache_config["max-entries"],
+        )
+    git_mirrors = None
+    if (mirrors_config := config["git-mirrors"])["enabled"]:
+        git_mirrors = GitMirrorCache(
+            os.path.join(config["paths"]["tmp"], "git-mirrors"),
+            max_size=mirrors_config["max-size"] * 1024 * 1024,
+            refresh_interval=mirrors_config["refresh-interval"],
+            timeout=mirrors_config["timeout"],
+        )
+
+    admission_config = config["admission"]
+    admission = AdmissionController(
+        per_user_active=admission_config["per-user-active"],
+        per_user_running=admission_config["per-user-running"],
+        max_running=admission_config["max-running"] or workers,
+        user_rate=admission_config["user-rate"] / 60,
+        user_burst=admission_config["user-burst"],
+        global_rate=admission_config["global-rate"] / 60,
+        global_burst=admission_config["global-burst"],
+    )
+
+    job_queue = JobQueue(
+        workers=workers,
+        queue_size=jobs_config["queue-size"],
+        retention=jobs_config["retention"],
+        poll_interval=jobs_config["poll-interval"],
+        output_buffer=jobs_config["output-buffer"],
+        stderr_tail=jobs_config["stderr-tail"],
+        cgroup_root=jobs_config["cgroup-root"],
+        sample_interval=config["metrics"]["sample-interval"],
+        fork_server=fork_server,
+        result_cache=result_cache,
+        git_mirrors=git_mirrors,
+        admission=admission,
+        history=get_run_history(),
+    )
+    QUEUE_DEPTH.set_function(lambda: job_queue.stats()["queued"])
+    RUNS_ACTIVE.set_function(lambda: job_queue.stats()["running"])
+    SUBPROCESSES_ACTIVE.set_function(job_queue.subprocess_count)
+    return job_queue
@@ -0,0 +1,170 @@
+"""Pull the records of one run from the JSON app logs, rotated ones included.
+
+Usage: python log_query.py RUN_ID [--log PATH] [--json]
+
+Each log file gets an index of record offsets by run ID (SQLite) in the
+`.index` directory next to it, outside the names the log rotation counts as
+backups. It is extended incrementally with the records written since the
+last query, so a lookup only reads the run's records.
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import sys
+
+import toml
+
+_RUN_ID_RE = re.compile(rb'"run_id": "([^"]+)"')
+
+INDEX_DIR = ".index"
+INDEX_SUFFIX = ".idx"
+INDEX_BATCH_SIZE = 64 * 1024 * 1024
+
+
+class LogIndex:
+    """Offsets of the records of every run in a log file."""
+
+    def __init__(self, log_path: str) -> None:
+        self.log_path = log_path
+        self._db = sqlite3.connect(index_path(log_path), isolation_level=None)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (inode INTEGER, size INTEGER);
+            CREATE TABLE IF NOT EXISTS records (
+                run_id TEXT, offset INTEGER, length INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS records_run_id ON records (run_id);
+            """
+        )
+
+    def update(self) -> None:
+        """Index the complete records appended since the last update."""
+        with open(self.log_path, "rb") as file:
+            inode = os.fstat(file.fileno()).st_ino
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT inode, size FROM meta").fetchone()
+                if row is None or row[0] != inode:
+                    # NOTE: The path now names a rotated or recreated file
+                    self._db.execute("DELETE FROM meta")
+                    self._db.execute("DELETE FROM records")
+                    self._db.execute("INSERT INTO meta VALUES (?, 0)", (inode,))
+                    indexed_size = 0
+                else:
+                    indexed_size = row[1]
+                file.seek(indexed_size)
+                while chunk := file.read(INDEX_BATCH_SIZE):
+                    # NOTE: A record being written is left for the next update
+                    complete = chunk[: chunk.rfind(b"\n") + 1]
+                    if not complete:
+                        break
+                    self._db.executemany(
+                        "INSERT INTO records VALUES (?, ?, ?)",
+                        self._scan(complete, indexed_size),
+                    )
+                    indexed_size += len(complete)
+                    file.seek(indexed_size)
+                self._db.execute("UPDATE meta SET size = ?", (indexed_size,))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _scan(chunk: bytes, base_offset: int):
+        start = 0
+        while start < len(chunk):
+            end = chunk.index(b"\n", start) + 1
+            if match := _RUN_ID_RE.search(chunk, start, end):
+                yield match.group(1).decode(), base_offset + start, end - start
+            start = end
+
+    def lookup(self, run_id: str) -> list[tuple[int, int]]:
+        return self._db.execute(
+            "SELECT offset, length FROM records WHERE run_id = ? ORDER BY offset",
+            (run_id,),
+        ).fetchall()
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def index_path(log_path: str) -> str:
+    """Return the path of the index of a log file, creating its directory."""
+    index_dir = os.path.join(os.path.dirname(log_path), INDEX_DIR)
+    os.makedirs(index_dir, exist_ok=True)
+    return os.path.join(index_dir, f"{os.path.basename(log_path)}{INDEX_SUFFIX}")
+
+
+def log_files(log_path: str) -> list[str]:
+    """Return the log file and its rotated copies, oldest first."""
+    # NOTE: Indexes of older versions were kept next to the logs
+    paths = [
+        path
+        for path in glob.glob(f"{glob.escape(log_path)}*")
+        if not path.endswith((INDEX_SUFFIX, ".lock"))
+    ]
+    return sorted(paths, key=os.path.getmtime)
+
+
+def _remove_stale_indexes(log_path: str) -> None:
+    """Remove the indexes of rotated logs the rotation has deleted."""
+    index_dir = os.path.join(os.path.dirname(log_path), INDEX_DIR)
+    prefix = os.path.basename(log_path)
+    for filename in os.listdir(index_dir):
+        if filename.startswith(prefix) and filename.endswith(INDEX_SUFFIX):
+            log_file = os.path.join(
+                os.path.dirname(log_path), filename.removesuffix(INDEX_SUFFIX)
+            )
+            if not os.path.exists(log_file):
+                os.remove(os.path.join(index_dir, filename))
+
+
+def query_run(log_path: str, run_id: str) -> list[dict]:
+    records = []
+    for path in log_files(log_path):
+        index = LogIndex(path)
+        try:
+            index.update()
+            offsets = index.lookup(run_id)
+        finally:
+            index.close()
+        if not offsets:
+            continue
+        with open(path, "rb") as file:
+            for offset, length in offsets:
+                file.seek(offset)
+                records.append(json.loads(file.read(length)))
+    _remove_stale_indexes(log_path)
+    return records
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("run_id")
+    parser.add_argument("--log", help="Log file, paths.log of config.toml by default")
+    parser.add_argument("--json", action="store_true", help="Print raw JSON records")
+    args = parser.parse_args()
+
+    log_path = args.log or toml.load("config.toml")["paths"]["log"]
+    records = query_run(log_path, args.run_id)
+    if not records:
+        sys.exit(f"No records of run {args.run_id} in {log_path}")
+    for record in records:
+        if args.json:
+            print(json.dumps(record, ensure_ascii=False))
+            continue
+        elapsed = record.get("elapsed")
+        print(
+            f"{record['time']} "
+            f"{'' if elapsed is None else f'+{elapsed:.3f}s':>10} "
+            f"{record['level']:<8} {record['message']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
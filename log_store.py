@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+from collections import deque
+
+
+class RunLog:
+    """Console transcript of a single run.
+
+    The most recent `memory_limit` bytes are kept in memory as a ring of
+    sealed chunks, while the full transcript is appended to `path` on disk.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        memory_limit: int = 64 * 1024,
+        chunk_size: int = 4096,
+        flush_interval: float = 0.25,
+    ) -> None:
+        self.path = path
+        self.memory_limit = memory_limit
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.size = 0
+        self._chunks: deque[str] = deque()
+        self._chunks_size = 0
+        self._current: list[str] = []
+        self._current_size = 0
+        self._file = None
+        self._flushed_at = 0.0
+        self._lock = threading.Lock()
+
+    def append(self, line: str) -> None:
+        line += "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self.size += len(line)
+            self._current.append(line)
+            self._current_size += len(line)
+            if self._current_size >= self.chunk_size:
+                self._seal()
+            if time.monotonic() - self._flushed_at >= self.flush_interval:
+                self._file.flush()
+                self._flushed_at = time.monotonic()
+
+    def _seal(self) -> None:
+        self._chunks.append("".join(self._current))
+        self._chunks_size += self._current_size
+        self._current = []
+        self._current_size = 0
+        while self._chunks and self._chunks_size > self.memory_limit:
+            self._chunks_size -= len(self._chunks.popleft())
+
+    def flush(self) -> None:
+        """Write buffered lines to disk, for readers of the file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                self._flushed_at = time.monotonic()
+
+    def tail(self) -> str:
+        """Return the in-memory tail of the transcript."""
+        with self._lock:
+            return "".join(self._chunks) + "".join(self._current)
+
+    @property
+    def truncated(self) -> bool:
+        return self.size > self._chunks_size + self._current_size
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def count_log_pages(path: str, page_size: int) -> int:
+    try:
+        return max(1, -(-os.path.getsize(path) // page_size))
+    except OSError:
+        return 1
+
+
+def read_log_page(path: str, page: int, page_size: int) -> str:
+    """Read the `page`-th block of `page_size` bytes, aligned to whole lines."""
+    try:
+        with open(path, "rb") as file:
+            start = page * page_size
+            if start > 0:
+                # The line crossing the page start belongs to the previous page
+                file.seek(start - 1)
+                file.readline()
+            data = file.read(max(0, (page + 1) * page_size - file.tell()))
+            if data and not data.endswith(b"\n"):
+                data += file.readline()
+    except OSError:
+        return ""
+    return data.decode(errors="replace")
@@ -0,0 +1,189 @@
+import json
+import os
+import secrets
+import threading
+import time
+from collections.abc import Callable
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlsplit
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from config_store import get_base_configuration
+from log_store import RunLog
+from sidecar import get_sidecar
+
+LOG_STREAM_ROUTE = "/logs/"
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _event(data: bytes, offset: int) -> bytes:
+    # NOTE: A carriage return ends an SSE line, progress bars use them alone
+    lines = data.decode(errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+    return (
+        f"id: {offset}\n"
+        + "".join(f"data: {line}\n" for line in lines.rstrip("\n").split("\n"))
+        + "\n"
+    ).encode()
+
+
+class LogStreamRegistry:
+    """Console output of runs streamed from their run logs as Server-Sent Events.
+
+    Each run gets an unguessable token; `/logs/<token>` sends the lines
+    appended to the run log as events whose ID is the byte offset after
+    them, so a reconnecting EventSource resumes from `Last-Event-ID`.
+    A new stream starts at `?offset=`, or `?tail=` bytes before the end
+    of the log. Streams check the log every `poll_interval` seconds and
+    end with an `end` event once the run is done.
+    """
+
+    def __init__(self, ttl: float, poll_interval: float, heartbeat: float) -> None:
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self._streams: dict[str, tuple[RunLog, Callable[[], bool], float]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, run_log: RunLog, is_done: Callable[[], bool]) -> str:
+        token = secrets.token_urlsafe(24)
+        with self._lock:
+            now = time.time()
+            for expired in [
+                t for t, (*_, expires_at) in self._streams.items() if expires_at < now
+            ]:
+                del self._streams[expired]
+            self._streams[token] = (run_log, is_done, now + self.ttl)
+        return get_sidecar().url_for(f"{LOG_STREAM_ROUTE}{token}")
+
+    @staticmethod
+    def _start_offset(request: BaseHTTPRequestHandler) -> int | None:
+        """Return the offset to resume from, None to start from the tail."""
+        last_event_id = request.headers.get("Last-Event-ID", "")
+        if last_event_id.isdigit():
+            return int(last_event_id)
+        offset = parse_qs(urlsplit(request.path).query).get("offset", [""])[0]
+        return int(offset) if offset.isdigit() else None
+
+    def handle(self, request: BaseHTTPRequestHandler, path: str) -> None:
+        with self._lock:
+            entry = self._streams.get(path.split("/", 1)[0])
+        if entry is None or entry[2] < time.time():
+            request.send_error(HTTPStatus.NOT_FOUND)
+            return
+        run_log, is_done, _ = entry
+        offset = self._start_offset(request)
+        tail = int(parse_qs(urlsplit(request.path).query).get("tail", ["0"])[0] or 0)
+
+        request.close_connection = True
+        request.send_response(HTTPStatus.OK)
+        request.send_header("Content-Type", "text/event-stream")
+        request.send_header("Cache-Control", "no-cache")
+        request.send_header("Connection", "close")
+        request.send_header("X-Accel-Buffering", "no")
+        # NOTE: The viewer runs in a component iframe of the Streamlit origin,
+        # access is granted by the token alone
+        request.send_header("Access-Control-Allow-Origin", "*")
+        request.end_headers()
+        request.wfile.write(b"retry: 1000\n\n")
+        request.wfile.flush()
+
+        file = None
+        sent_at = time.monotonic()
+        try:
+            while True:
+                done = is_done()
+                run_log.flush()
+                if file is None and os.path.exists(run_log.path):
+                    file = open(run_log.path, "rb")
+                    if offset is None:
+                        size = os.fstat(file.fileno()).st_size
+                        offset = max(0, size - tail) if tail else 0
+                        if offset > 0:
+                            # NOTE: Start at the first whole line of the tail
+                            file.seek(offset - 1)
+                            file.readline()
+                            offset = file.tell()
+                data = b""
+                if file is not None:
+                    file.seek(offset)
+                    data = file.read(STREAM_CHUNK_SIZE)
+                    # NOTE: A line being written is sent once it is complete,
+                    # unless it alone fills a chunk
+                    end = data.rfind(b"\n") + 1
+                    if (end or len(data) < STREAM_CHUNK_SIZE) and (
+                        not done or len(data) == STREAM_CHUNK_SIZE
+                    ):
+                        data = data[:end]
+                if data:
+                    offset += len(data)
+                    request.wfile.write(_event(data, offset))
+                    request.wfile.flush()
+                    sent_at = time.monotonic()
+                    continue
+                if done:
+                    request.wfile.write(
+                        f"id: {offset or 0}\nevent: end\ndata:\n\n".encode()
+                    )
+                    request.wfile.flush()
+                    return
+                if time.monotonic() - sent_at >= self.heartbeat:
+                    request.wfile.write(b": keep-alive\n\n")
+                    request.wfile.flush()
+                    sent_at = time.monotonic()
+                time.sleep(self.poll_interval)
+        finally:
+            if file is not None:
+                file.close()
+
+
+_VIEWER_HTML = """\
+<style>
+  body {{ margin: 0; }}
+  pre {{
+    box-sizing: border-box; height: {height}px; margin: 0; padding: 1rem;
+    overflow: auto; border-radius: 0.5rem; background: #f0f2f6; color: #31333f;
+    font: 14px/1.6 "Source Code Pro", monospace; white-space: pre-wrap;
+  }}
+</style>
+<pre id="log"></pre>
+<script>
+  const log = document.getElementById("log");
+  const maxLines = {max_lines};
+  let lines = [];
+  const source = new EventSource({url});
+  source.onmessage = (event) => {{
+    const follow = log.scrollTop + log.clientHeight >= log.scrollHeight - 20;
+    lines.push(...event.data.split("\\n"));
+    if (lines.length > maxLines) lines = lines.slice(-maxLines);
+    log.textContent = lines.join("\\n");
+    if (follow) log.scrollTop = log.scrollHeight;
+  }};
+  source.addEventListener("end", () => source.close());
+</script>
+"""
+
+
+def render_log_stream(url: str, max_lines: int, tail: int, height: int = 350) -> None:
+    """Show the console output of a run as it is streamed from `url`."""
+    components.html(
+        _VIEWER_HTML.format(
+            url=json.dumps(f"{url}?tail={tail}"), max_lines=max_lines, height=height
+        ),
+        height=height,
+    )
+
+
+@st.cache_resource
+def get_log_streams() -> LogStreamRegistry:
+    config = get_base_configuration()
+    registry = LogStreamRegistry(
+        ttl=config["sidecar"]["download-ttl"],
+        poll_interval=config["log-stream"]["poll-interval"],
+        heartbeat=config["log-stream"]["heartbeat"],
+    )
+    get_sidecar().add_route(LOG_STREAM_ROUTE, registry.handle)
+    return registry
@@ -0,0 +1,50 @@
+import threading
+import time
+from collections import deque
+
+
+class LogView:
+    """Tail window over the console output of a run.
+
+    Worker threads only append lines, which is O(1). The text shown in the UI
+    is rebuilt lazily from the tail window, at most once per `flush_interval`
+    seconds unless `flush_lines` new lines are already pending.
+    """
+
+    def __init__(
+        self,
+        tail_lines: int = 500,
+        flush_interval: float = 0.25,
+        flush_lines: int = 200,
+    ) -> None:
+        self.tail_lines = tail_lines
+        self.flush_interval = flush_interval
+        self.flush_lines = flush_lines
+        self.line_count = 0
+        self._tail: deque[str] = deque(maxlen=tail_lines)
+        self._pending = 0
+        self._text = ""
+        self._flushed_at = 0.0
+        self._lock = threading.Lock()
+
+    def append(self, line: str) -> None:
+        with self._lock:
+            self._tail.append(line)
+            self._pending += 1
+            self.line_count += 1
+
+    def text(self) -> str:
+        """Return the rendered tail window, flushing pending lines if due."""
+        with self._lock:
+            if self._pending and (
+                self._pending >= self.flush_lines
+                or time.monotonic() - self._flushed_at >= self.flush_interval
+            ):
+                self._text = "\n".join(self._tail)
+                self._pending = 0
+                self._flushed_at = time.monotonic()
+            return self._text
+
+    @property
+    def truncated(self) -> bool:
+        return self.line_count > self.tail_lines
@@ -1,30 +1,247 @@
+import atexit
+import contextlib
+import contextvars
+import copy
+import datetime
+import fcntl
+import json
 import logging
-from logging.handlers import TimedRotatingFileHandler
+import os
+import queue
+import time
+from dataclasses import dataclass
+from typing import Any, Iterator
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 
 import streamlit as st
-import toml
+
+from config_store import BaseConfiguration, get_config_service
+
+LOG_CONTEXT_FIELDS = ("run_id", "user", "repo", "mode")
+
+_log_context: contextvars.ContextVar[dict[str, Any]] = contextvars.ContextVar(
+    "log_context", default={}
+)
+
+
+@contextlib.contextmanager
+def log_context(**fields) -> Iterator[None]:
+    """Add fields to the records logged inside the block and tasks it starts.
+
+    A `started_at` timestamp adds the seconds elapsed since then to records.
+    """
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def set_log_context(**fields) -> None:
+    """Replace the fields of records logged from now on by the current thread."""
+    _log_context.set(fields)
+
+
+class _ContextQueueHandler(QueueHandler):
+    """Queue handler attaching the log context while still in the logging thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        context = _log_context.get()
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self.formatter.formatException(record.exc_info)
+        record.exc_info = None
+        record.stack_info = None
+        for name in LOG_CONTEXT_FIELDS:
+            setattr(record, name, context.get(name))
+        started_at = context.get("started_at")
+        record.elapsed = round(record.created - started_at, 3) if started_at else None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects including the log context."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        for name in (*LOG_CONTEXT_FIELDS, "elapsed"):
+            entry[name] = getattr(record, name, None)
+        if record.exc_info:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SharedTimedRotatingFileHandler(TimedRotatingFileHandler):
+    """Timed rotating file handler writing records in batches.
+
+    Records are buffered and written with a single write once `flush_records`
+    of them are pending, the oldest is `flush_interval` seconds old, or the
+    listener runs idle. The log file is opened in append mode, so batches of
+    several server processes sharing it do not interleave. Rotation is done
+    under a lock file by the first process due; the others reopen the new file.
+    """
+
+    def __init__(
+        self, filename: str, flush_records: int, flush_interval: float, **kwargs
+    ) -> None:
+        super().__init__(filename, **kwargs)
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval
+        self._buffer: list[str] = []
+        self._buffered_at = 0.0
+        self._lock_path = f"{self.baseFilename}.lock"
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            if self.shouldRollover(record):
+                self.flush()
+                self.doRollover()
+            if not self._buffer:
+                self._buffered_at = time.monotonic()
+            self._buffer.append(self.format(record) + self.terminator)
+            if (
+                len(self._buffer) >= self.flush_records
+                or time.monotonic() - self._buffered_at >= self.flush_interval
+            ):
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        with self.lock:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write("".join(self._buffer))
+            self.stream.flush()
+            self._buffer.clear()
+
+    def _rotated_elsewhere(self) -> bool:
+        try:
+            return (
+                os.stat(self.baseFilename).st_ino
+                != os.fstat(self.stream.fileno()).st_ino
+            )
+        except (OSError, AttributeError, ValueError):
+            return False
+
+    def doRollover(self) -> None:
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if not self._rotated_elsewhere():
+                    super().doRollover()
+                    return
+                self.stream.close()
+                self.stream = self._open()
+                self.rolloverAt = self.computeRollover(int(time.time()))
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        self.flush()
+        super().close()
+
+
+class _FlushingQueueListener(QueueListener):
+    """Queue listener flushing its handlers whenever the queue runs empty."""
+
+    def __init__(
+        self, log_queue: queue.Queue, *handlers, flush_interval: float
+    ) -> None:
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        while True:
+            try:
+                return self.queue.get(block, timeout=self.flush_interval)
+            except queue.Empty:
+                for handler in self.handlers:
+                    handler.flush()
+
+
+@dataclass(frozen=True)
+class OutputLogPolicy:
+    """Which osa-tool output lines reach the app log, and at which level.
+
+    Every `sample`-th line of a run is logged, 0 logs none of them.
+    """
+
+    level: int = logging.DEBUG
+    sample: int = 1
+
+    @classmethod
+    def from_config(cls, config: dict) -> "OutputLogPolicy":
+        return cls(
+            level=logging.getLevelName(config["output-level"]),
+            sample=config["output-sample"],
+        )
+
+    def should_log(self, line_number: int) -> bool:
+        return self.sample > 0 and line_number % self.sample == 0
 
 
 @st.cache_resource
-def setup_logger(log_file_path):
+def setup_logger(log_file_path, level="DEBUG", flush_interval=1.0, flush_records=256):
     logger = logging.getLogger("Streamlit App")
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(level)
 
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
+    formatter = JsonFormatter()
 
-    handler = TimedRotatingFileHandler(
+    handler = SharedTimedRotatingFileHandler(
         log_file_path,
+        flush_records=flush_records,
+        flush_interval=flush_interval,
         when="W6",
         interval=1,
         backupCount=4,
     )
     handler.setFormatter(formatter)
 
-    logger.addHandler(handler)
+    # NOTE: Callers only enqueue records, the file is written by the listener thread
+    log_queue = queue.SimpleQueue()
+    queue_handler = _ContextQueueHandler(log_queue)
+    queue_handler.setFormatter(formatter)
+    logger.addHandler(queue_handler)
+    listener = _FlushingQueueListener(log_queue, handler, flush_interval=flush_interval)
+    listener.start()
+    atexit.register(listener.stop)
 
     return logger
 
 
-logger = setup_logger(toml.load("config.toml")["paths"]["log"])
+_config_service = get_config_service()
+_config = _config_service.current
+logger = setup_logger(
+    _config["paths"]["log"],
+    level=_config["logging"]["level"],
+    flush_interval=_config["logging"]["flush-interval"],
+    flush_records=_config["logging"]["flush-records"],
+)
+_output_log_policy = OutputLogPolicy.from_config(_config["logging"])
+
+
+def get_output_log_policy() -> OutputLogPolicy:
+    """Return the output log policy of the current configuration."""
+    return _output_log_policy
+
+
+def _apply_logging_config(config: BaseConfiguration) -> None:
+    global _output_log_policy
+    logger.setLevel(config["logging"]["level"])
+    _output_log_policy = OutputLogPolicy.from_config(config["logging"])
+
+
+_config_service.subscribe(_apply_logging_config)
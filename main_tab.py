@@ -1,12 +1,24 @@
-import asyncio
+import os
 import pathlib
 import tempfile
+import time
+import uuid
 
 import streamlit as st
 import streamlit.components.v1 as components
 
-from logger_config import logger
-from utils import run_osa_tool
+from admission import JobRejected
+from config_store import get_base_configuration
+from downloads import get_download_registry
+from jobs import JOB_QUEUED, Job, get_job_queue
+from log_store import RunLog, count_log_pages, read_log_page
+from log_stream import get_log_streams, render_log_stream
+from log_view import LogView
+from logger_config import log_context, logger
+from phases import PhaseTimeline
+from run_history import RunRecord, get_run_history
+from sandbox import ExecutionProfile
+from utils import build_osa_command
 
 
 def reset_attachment_selection() -> None:
@@ -61,7 +73,7 @@ def confirm_public_run() -> None:
             st.rerun()
     with right:
         if st.button("Yes", use_container_width=True, type="primary"):
-            st.session_state.running = True
+            _submit_osa_job()
             st.rerun()
 
 
@@ -137,13 +149,280 @@ def render_input_block() -> None:
             )
 
 
+def create_osa_job(repo_url: str, output_dir: str, batch_id: str | None = None) -> Job:
+    """Create a run of the repository with the session's mode and configuration.
+
+    osa-tool writes into a directory of its own inside `output_dir`, next
+    to the run log.
+    """
+    job_id = uuid.uuid4().hex
+    run_dir = os.path.join(output_dir, f"run_{job_id}")
+    cmd, env = build_osa_command(repo_url, run_dir)
+    log_view_config = st.session_state.configuration["log-view"]
+    log_store_config = st.session_state.configuration["log-store"]
+    git_configuration = st.session_state.configuration[st.session_state.mode_select][
+        "git"
+    ]
+    return Job(
+        id=job_id,
+        cmd=cmd,
+        env=env,
+        user=st.user.get("name", "Username"),
+        user_id=st.user.get("email") or st.user.get("name", "Username"),
+        repo_url=repo_url,
+        mode=st.session_state.mode_select,
+        tmpdirname=output_dir,
+        output_dir=run_dir,
+        branch=git_configuration["branch"],
+        use_cache=git_configuration["no-pull-request"],
+        batch_id=batch_id,
+        config_version=st.session_state.configuration.base.version,
+        profile=ExecutionProfile.from_config(
+            st.session_state.configuration[st.session_state.mode_select]["limits"]
+        ),
+        run_log=RunLog(
+            os.path.join(output_dir, f"osa_run_{job_id}.log"),
+            memory_limit=log_store_config["memory-limit"] * 1024,
+            chunk_size=log_store_config["chunk-size"] * 1024,
+        ),
+        log_view=LogView(
+            tail_lines=log_view_config["tail-lines"],
+            flush_interval=log_view_config["flush-interval"],
+            flush_lines=log_view_config["flush-lines"],
+        ),
+    )
+
+
+def _reset_output() -> None:
+    st.session_state.output_report_paths = []
+    st.session_state.output_report_filenames = []
+    for key in (
+        "output_about_section",
+        "output_logs",
+        "output_log_path",
+        "output_log_url",
+        "output_report_urls",
+        "output_exit_code",
+        "output_timeline",
+    ):
+        if key in st.session_state:
+            del st.session_state[key]
+
+
+def _submit_osa_job() -> None:
+    # Reset streamlit state
+    _reset_output()
+
+    job = create_osa_job(st.session_state.repo_url, st.session_state.tmpdirname)
+    with log_context(run_id=job.id, user=job.user_id, repo=job.repo_url, mode=job.mode):
+        try:
+            get_job_queue().submit(job)
+        except JobRejected as e:
+            logger.warning(f"Rejected run of {job.repo_url} by {job.user_id}: {e!s}")
+            st.session_state.output_logs = ""
+            st.session_state.output_exit_code = -1
+            st.session_state.output_message = f"**Run was not started**: {e!s}"
+            st.query_params.pop("job", None)
+            return
+    st.session_state.job_id = job.id
+    st.session_state.running = True
+    # NOTE: The run is detached from the session, a reloaded page reattaches to it
+    st.query_params["job"] = job.id
+
+
+def reattach_osa_job(job_id: str) -> None:
+    """Show a run of the user in the Home tab, in progress or from the run history."""
+    user_id = st.user.get("email") or st.user.get("name", "Username")
+    job = get_job_queue().get(job_id)
+    if job is not None and job.user_id == user_id and job.batch_id is None:
+        _reset_output()
+        st.session_state.job_id = job.id
+        st.session_state.running = True
+        st.query_params["job"] = job.id
+        return
+    history = get_run_history()
+    run = history and history.get(job_id)
+    if run is not None and run.user_id == user_id and run.done:
+        _reset_output()
+        _collect_run_results(run)
+        st.query_params["job"] = run.id
+        return
+    logger.warning(f"Run {job_id} to reattach to was not found")
+    st.query_params.pop("job", None)
+
+
 def _set_osa_running():
     if not st.session_state.configuration[st.session_state.mode_select]["git"][
         "no-pull-request"
     ]:
         confirm_public_run()
     else:
-        st.session_state.running = True
+        _submit_osa_job()
+
+
+def _collect_job_results(job: Job | None) -> None:
+    st.session_state.running = False
+    del st.session_state["job_id"]
+    if job is None:
+        st.session_state.output_logs = ""
+        st.session_state.output_exit_code = -1
+        st.session_state.output_message = "**Error running OSA tool**: run was lost"
+        return
+    st.session_state.output_logs = job.run_log.tail()
+    st.session_state.output_log_path = job.run_log.path
+    st.session_state.output_report_paths = job.output_report_paths
+    st.session_state.output_report_filenames = job.output_report_filenames
+    # NOTE: Files are registered once per run and downloaded from the sidecar,
+    # so reruns of the results page never read them
+    download_registry = get_download_registry()
+    st.session_state.output_report_urls = [
+        download_registry.register(path, filename, "application/pdf")
+        for path, filename in zip(job.output_report_paths, job.output_report_filenames)
+    ]
+    st.session_state.output_log_url = download_registry.register(
+        job.run_log.path, os.path.basename(job.run_log.path), "text/plain"
+    )
+    if job.output_about_section is not None:
+        st.session_state.output_about_section = job.output_about_section
+    st.session_state.output_timeline = _timeline_rows(job.timeline, job.started_at)
+    if job.error is not None:
+        st.session_state.output_exit_code = -1
+        st.session_state.output_message = f"**Error running OSA tool**: `{job.error}`"
+    else:
+        st.session_state.output_exit_code = job.output_exit_code
+        st.session_state.output_message = job.output_message
+
+
+def _collect_run_results(run: RunRecord) -> None:
+    download_registry = get_download_registry()
+    st.session_state.output_logs = ""
+    if run.log_path is not None and os.path.exists(run.log_path):
+        st.session_state.output_log_path = run.log_path
+        st.session_state.output_log_url = download_registry.register(
+            run.log_path, os.path.basename(run.log_path), "text/plain"
+        )
+    reports = [
+        (path, filename)
+        for path, filename in zip(run.report_paths, run.report_filenames)
+        if os.path.exists(path)
+    ]
+    st.session_state.output_report_paths = [path for path, _ in reports]
+    st.session_state.output_report_filenames = [filename for _, filename in reports]
+    st.session_state.output_report_urls = [
+        download_registry.register(path, filename, "application/pdf")
+        for path, filename in reports
+    ]
+    if run.about_section is not None:
+        st.session_state.output_about_section = run.about_section
+    st.session_state.output_exit_code = run.exit_code
+    st.session_state.output_message = run.message
+
+
+def _timeline_rows(timeline: PhaseTimeline, started_at: float | None) -> list[dict]:
+    if started_at is None:
+        return []
+    now = time.time()
+    return [
+        {
+            "phase": phase.name,
+            "start": round(phase.started_at - started_at, 1),
+            "end": round(phase.started_at + phase.duration(now) - started_at, 1),
+            "duration": round(phase.duration(now), 1),
+        }
+        for phase in timeline.phases()
+    ]
+
+
+def render_timeline(rows: list[dict]) -> None:
+    """Show the stages of a run as bars over the seconds since it started."""
+    if not rows:
+        return
+    st.vega_lite_chart(
+        rows,
+        {
+            "mark": {"type": "bar", "cornerRadius": 3},
+            "encoding": {
+                "y": {"field": "phase", "type": "nominal", "sort": None, "title": None},
+                "x": {
+                    "field": "start",
+                    "type": "quantitative",
+                    "title": "Seconds since start",
+                },
+                "x2": {"field": "end"},
+                "tooltip": [
+                    {"field": "phase", "title": "Phase"},
+                    {"field": "duration", "title": "Duration, s"},
+                ],
+            },
+        },
+        use_container_width=True,
+    )
+
+
+def _cancel_osa_job() -> None:
+    get_job_queue().cancel(st.session_state.job_id)
+
+
+# NOTE: The interval is read when the module is imported, a plain setting
+# keeps that from starting the job queue
+@st.fragment(run_every=get_base_configuration()["jobs"]["poll-interval"])
+def render_job_progress() -> None:
+    job_queue = get_job_queue()
+    job = job_queue.get(st.session_state.job_id)
+    if job is None or job.done:
+        _collect_job_results(job)
+        st.rerun(scope="app")
+
+    left, right = st.columns([0.8, 0.2], vertical_alignment="center")
+    with right:
+        st.button(
+            "Cancel",
+            icon=":material/cancel:",
+            use_container_width=True,
+            disabled=job.cancel_requested,
+            on_click=_cancel_osa_job,
+        )
+    with left:
+        if job.cancel_requested:
+            st.warning("Cancelling...", icon=":material/hourglass_empty:")
+        elif job.status == JOB_QUEUED:
+            stats = job_queue.stats()
+            st.info(
+                f"Queued: position {job_queue.position(job.id)} of {stats['queued']}, "
+                f"{stats['running']} runs in progress on the server",
+                icon=":material/hourglass_empty:",
+            )
+        else:
+            phase = job.timeline.current
+            st.info(
+                f"In progress{f': {phase.name}' if phase else '...'} "
+                f"({time.time() - job.started_at:.0f}s)",
+                icon=":material/progress_activity:",
+            )
+    if job.status == JOB_QUEUED:
+        return
+    render_timeline(_timeline_rows(job.timeline, job.started_at))
+    # TODO: developer only
+    with st.expander("See Console Output", icon=":material/terminal:"):
+        if st.session_state.configuration["log-stream"]["enabled"]:
+            # NOTE: Output is streamed from the sidecar, so reruns of the
+            # fragment send no log lines; the URL is kept for the viewer to stay
+            if st.session_state.get("log_stream_job_id") != job.id:
+                st.session_state.log_stream_url = get_log_streams().register(
+                    job.run_log, lambda: job.done
+                )
+                st.session_state.log_stream_job_id = job.id
+            render_log_stream(
+                st.session_state.log_stream_url,
+                max_lines=job.log_view.tail_lines,
+                tail=job.run_log.memory_limit,
+            )
+            return
+        if job.log_view.truncated:
+            st.caption(
+                f"Showing the last {job.log_view.tail_lines} of {job.log_view.line_count} lines"
+            )
+        st.code(job.log_view.text(), height=350)
 
 
 def render_button_block() -> None:
@@ -164,6 +443,36 @@ def render_button_block() -> None:
     )
 
 
+def render_console_output() -> None:
+    log_path = st.session_state.get("output_log_path")
+    if (
+        log_path is None
+        or "output_log_url" not in st.session_state
+        or not os.path.exists(log_path)
+    ):
+        st.code(st.session_state.output_logs, height=350)
+        return
+
+    page_size = st.session_state.configuration["log-store"]["page-size"] * 1024
+    pages = count_log_pages(log_path, page_size)
+    page = pages
+    if pages > 1:
+        page = st.number_input(
+            "Page",
+            key="console-output-page",
+            min_value=1,
+            max_value=pages,
+            value=pages,
+            help=f"The console output is split into pages of {page_size // 1024} KB",
+        )
+    st.code(read_log_page(log_path, page - 1, page_size), height=350)
+    st.link_button(
+        "Download Full Log",
+        url=st.session_state.output_log_url,
+        icon=":material/download:",
+    )
+
+
 def render_output_block(output_container) -> None:
     with output_container:
         with st.container():
@@ -188,20 +497,13 @@ def render_output_block(output_container) -> None:
                         )
                 with right:
                     if len(st.session_state.output_report_paths) > 0:
-                        for i in range(len(st.session_state.output_report_paths)):
-                            with open(
-                                st.session_state.output_report_paths[i], "rb"
-                            ) as file:
-                                st.download_button(
-                                    label="Download Report",
-                                    data=file,
-                                    file_name=st.session_state.output_report_filenames[
-                                        i
-                                    ],
-                                    mime="application/pdf",
-                                    icon=":material/download:",
-                                    use_container_width=True,
-                                )
+                        for url in st.session_state.output_report_urls:
+                            st.link_button(
+                                "Download Report",
+                                url=url,
+                                icon=":material/download:",
+                                use_container_width=True,
+                            )
                     else:
                         with st.container(border=True):
                             st.markdown(
@@ -213,12 +515,12 @@ def render_output_block(output_container) -> None:
                         "About section", expanded=True, icon=":material/article:"
                     ):
                         st.write(st.session_state.output_about_section)
+                if st.session_state.get("output_timeline"):
+                    with st.expander("Timeline", icon=":material/timeline:"):
+                        render_timeline(st.session_state.output_timeline)
                 # TODO: developer only
                 with st.expander("See Console Output", icon=":material/terminal:"):
-                    st.code(
-                        st.session_state.output_logs,
-                        height=350,
-                    )
+                    render_console_output()
 
 
 def render_main_tab() -> None:
@@ -226,7 +528,6 @@ def render_main_tab() -> None:
     with center:
         render_input_block()
         render_button_block()
-    _, right = st.columns([0.35, 0.5])
     output_container = st.empty()
 
     if st.session_state.running:
@@ -239,8 +540,8 @@ def render_main_tab() -> None:
             height=0,
             scrolling=False,
         )
-        with right:
-            with st.spinner(text="In progress...", show_time=True, width="stretch"):
-                asyncio.run(run_osa_tool(output_container))
+        with output_container:
+            render_job_progress()
+        return
 
     render_output_block(output_container)
@@ -0,0 +1,321 @@
+import bisect
+import math
+import os
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler
+from typing import Callable
+
+import streamlit as st
+
+from config_store import get_base_configuration
+from sidecar import get_sidecar
+
+METRICS_ROUTE = "/metrics"
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], **extra) -> str:
+    pairs = [*zip(names, values), *extra.items()]
+    if not pairs:
+        return ""
+    return (
+        "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+    )
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return super().render() + [
+            f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+            for labels, value in values
+        ]
+
+
+class Gauge(_Metric):
+    """Gauge read from a callback when the metrics are scraped."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str) -> None:
+        super().__init__(name, help)
+        self._function: Callable[[], float] | None = None
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._function = function
+
+    def render(self) -> list[str]:
+        if self._function is None:
+            return []
+        return super().render() + [f"{self.name} {_format_value(self._function())}"]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        buckets: tuple[float, ...],
+        labels: tuple[str, ...] = (),
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = (*sorted(buckets), math.inf)
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            counts, total = self._values.setdefault(
+                label_values, ([0] * len(self.buckets), [0.0])
+            )
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            values = [
+                (labels, list(counts), total[0])
+                for labels, (counts, total) in self._values.items()
+            ]
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket"
+                    f"{_format_labels(self.labels, labels, le=_format_value(bound))} "
+                    f"{cumulative}"
+                )
+            lines.append(
+                f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(total)}"
+            )
+            lines.append(
+                f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}"
+            )
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics exported in the Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return (
+            "\n".join(line for metric in self._metrics for line in metric.render())
+            + "\n"
+        )
+
+    def handle(self, request: BaseHTTPRequestHandler, path: str) -> None:
+        body = self.render().encode()
+        request.send_response(HTTPStatus.OK)
+        request.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        if request.command != "HEAD":
+            request.wfile.write(body)
+
+
+registry = MetricsRegistry()
+
+RUNS = registry.register(
+    Counter("osa_runs_total", "Finished osa-tool runs.", ("mode", "status"))
+)
+RUN_EXIT_CODES = registry.register(
+    Counter(
+        "osa_run_exit_codes_total",
+        "Exit codes of osa-tool runs.",
+        ("mode", "exit_code"),
+    )
+)
+RUN_DURATION = registry.register(
+    Histogram(
+        "osa_run_duration_seconds",
+        "Wall time of osa-tool runs.",
+        (10, 30, 60, 120, 300, 600, 900, 1800, 3600, 5400),
+        ("mode",),
+    )
+)
+RUN_QUEUE_TIME = registry.register(
+    Histogram(
+        "osa_run_queue_seconds",
+        "Time osa-tool runs waited for a worker.",
+        (0.1, 1, 5, 15, 30, 60, 300, 900),
+        ("mode",),
+    )
+)
+RUN_PEAK_RSS = registry.register(
+    Histogram(
+        "osa_run_peak_rss_bytes",
+        "Peak resident memory of the osa-tool process group of a run.",
+        tuple(2**i * 1024 * 1024 for i in range(5, 15)),
+        ("mode",),
+    )
+)
+RUN_CPU = registry.register(
+    Histogram(
+        "osa_run_cpu_seconds",
+        "CPU time used by the osa-tool process group of a run.",
+        (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600),
+        ("mode",),
+    )
+)
+RUN_OUTPUT_LINES = registry.register(
+    Histogram(
+        "osa_run_output_lines",
+        "Lines of output of osa-tool runs.",
+        (100, 500, 1000, 5000, 10000, 50000, 100000),
+        ("mode",),
+    )
+)
+RUN_PHASE_DURATION = registry.register(
+    Histogram(
+        "osa_run_phase_duration_seconds",
+        "Wall time of the stages of osa-tool runs.",
+        (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600),
+        ("mode", "phase"),
+    )
+)
+REPORT_SIZE = registry.register(
+    Histogram(
+        "osa_report_size_bytes",
+        "Size of PDF reports created by osa-tool.",
+        tuple(2**i * 1024 for i in range(4, 14)),
+    )
+)
+QUEUE_DEPTH = registry.register(Gauge("osa_queue_depth", "Runs waiting for a worker."))
+RUNS_ACTIVE = registry.register(Gauge("osa_runs_active", "Runs being processed."))
+SUBPROCESSES_ACTIVE = registry.register(
+    Gauge("osa_subprocesses_active", "Running osa-tool processes.")
+)
+
+
+class ProcessGroupUsage:
+    """Peak memory and CPU time of a process group, sampled from /proc.
+
+    CPU time of a process that exited counts once its parent in the group
+    waited for it; the sum over live processes therefore only grows. With
+    a cgroup the kernel accounting of the cgroup is read instead, which
+    also covers what is used between samples.
+    """
+
+    def __init__(self, pgid: int, cgroup: str | None = None) -> None:
+        self.pgid = pgid
+        self.cgroup = cgroup
+        self.peak_rss = 0
+        self.cpu_seconds = 0.0
+
+    def sample(self) -> None:
+        if self.cgroup:
+            try:
+                self._sample_cgroup()
+                return
+            except (OSError, ValueError):
+                self.cgroup = None
+        rss = 0
+        cpu_ticks = 0
+        for entry in os.scandir("/proc"):
+            if not entry.name.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry.name}/stat", "rb") as file:
+                    stat = file.read()
+            except OSError:
+                continue
+            # NOTE: Fields after the parenthesized command name, starting at state
+            fields = stat[stat.rindex(b")") + 2 :].split()
+            if int(fields[2]) != self.pgid:
+                continue
+            cpu_ticks += sum(int(value) for value in fields[11:15])
+            rss += int(fields[21]) * _PAGE_SIZE
+        self.peak_rss = max(self.peak_rss, rss)
+        self.cpu_seconds = max(self.cpu_seconds, cpu_ticks / _CLOCK_TICKS)
+
+    def _sample_cgroup(self) -> None:
+        try:
+            with open(os.path.join(self.cgroup, "memory.peak")) as file:
+                rss = int(file.read())
+        except FileNotFoundError:
+            # NOTE: memory.peak needs Linux 5.19
+            with open(os.path.join(self.cgroup, "memory.current")) as file:
+                rss = int(file.read())
+        with open(os.path.join(self.cgroup, "cpu.stat")) as file:
+            stat = dict(line.split() for line in file)
+        self.peak_rss = max(self.peak_rss, rss)
+        self.cpu_seconds = max(self.cpu_seconds, int(stat["usage_usec"]) / 1_000_000)
+
+
+def observe_run(job) -> None:
+    """Record a run once its job is done."""
+    RUNS.inc(job.mode, job.status)
+    if job.output_exit_code is not None:
+        RUN_EXIT_CODES.inc(job.mode, str(job.output_exit_code))
+    if job.started_at is None or job.finished_at is None:
+        return
+    RUN_QUEUE_TIME.observe(job.started_at - job.submitted_at, job.mode)
+    RUN_DURATION.observe(job.finished_at - job.started_at, job.mode)
+    if job.cached:
+        return
+    RUN_OUTPUT_LINES.observe(job.output_lines, job.mode)
+    for phase, seconds in job.timeline.durations().items():
+        RUN_PHASE_DURATION.observe(seconds, job.mode, phase)
+    if job.peak_rss is not None:
+        RUN_PEAK_RSS.observe(job.peak_rss, job.mode)
+        RUN_CPU.observe(job.cpu_seconds, job.mode)
+    for path in job.output_report_paths:
+        try:
+            REPORT_SIZE.observe(os.path.getsize(path))
+        except OSError:
+            pass
+
+
+@st.cache_resource
+def get_metrics_exporter() -> MetricsRegistry | None:
+    if not get_base_configuration()["metrics"]["enabled"]:
+        return None
+    get_sidecar().add_route(METRICS_ROUTE, registry.handle)
+    return registry
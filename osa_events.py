@@ -0,0 +1,109 @@
+import re
+from dataclasses import dataclass
+from enum import Enum
+
+
+class EventKind(str, Enum):
+    REPORT_CREATED = "report_created"
+    ABOUT_LINE = "about_line"
+    PR_CREATED = "pr_created"
+    PHASE_START = "phase_start"
+    PHASE_END = "phase_end"
+    ERROR = "error"
+
+
+@dataclass(frozen=True, slots=True)
+class EventSpec:
+    """Description of an osa-tool output event.
+
+    `marker` is a literal that every line of the event contains. If `pattern`
+    is given it must also match the line, and its single capturing group (if
+    any) becomes the value of the event; otherwise the event has `value`.
+    """
+
+    kind: EventKind
+    marker: str
+    pattern: str | None = None
+    value: str | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class OsaEvent:
+    kind: EventKind
+    value: str | None
+    line: str
+
+
+class EventParser:
+    """Turns osa-tool output lines into typed events.
+
+    Markers of all registered events are compiled into one literal
+    alternation, so a line without events costs a single regex pass. Event
+    patterns only run on lines where their marker was found, and adding an
+    event never adds another pass over every line.
+    """
+
+    def __init__(self, specs: list[EventSpec] | None = None) -> None:
+        self._entries: dict[str, list[tuple[EventSpec, re.Pattern | None]]] = {}
+        self._trigger: re.Pattern | None = None
+        for spec in specs or ():
+            self.register(spec)
+
+    def register(self, spec: EventSpec) -> None:
+        regex = None
+        if spec.pattern is not None:
+            regex = re.compile(spec.pattern)
+            if regex.groups > 1:
+                raise ValueError(
+                    f"Event pattern may have at most one group: {spec.pattern!r}"
+                )
+        self._entries.setdefault(spec.marker, []).append((spec, regex))
+        markers = sorted(self._entries, key=len, reverse=True)
+        self._trigger = re.compile("(?:" + "|".join(map(re.escape, markers)) + ")")
+
+    def parse(self, line: str) -> OsaEvent | None:
+        if self._trigger is None:
+            return None
+        pos = 0
+        while match := self._trigger.search(line, pos):
+            for spec, regex in self._entries[match.group()]:
+                if regex is None:
+                    return OsaEvent(spec.kind, spec.value, line)
+                if event_match := regex.search(line):
+                    value = event_match.group(1) if regex.groups else spec.value
+                    return OsaEvent(spec.kind, value, line)
+            pos = match.start() + 1
+        return None
+
+
+# NOTE: Phase headers are printed by osa-tool as rich rules, e.g.
+# "───────── Docstrings generation ─────────"
+OSA_EVENT_SPECS = [
+    EventSpec(
+        EventKind.REPORT_CREATED,
+        "PDF report successfully created in",
+        r"PDF report successfully created in (\/.*\.pdf)",
+    ),
+    EventSpec(
+        EventKind.PR_CREATED,
+        "pull request created successfully:",
+        r"pull request created successfully: (\S*)",
+    ),
+    EventSpec(EventKind.ABOUT_LINE, "You can add the following"),
+    EventSpec(EventKind.ABOUT_LINE, "- Description:"),
+    EventSpec(EventKind.ABOUT_LINE, "- Homepage:"),
+    EventSpec(EventKind.ABOUT_LINE, "- Topics:"),
+    EventSpec(EventKind.ABOUT_LINE, "Please review and add them to your repository"),
+    EventSpec(EventKind.PHASE_START, "Cloning the '", value="Cloning"),
+    EventSpec(EventKind.PHASE_END, "Cloning completed", value="Cloning"),
+    EventSpec(EventKind.PHASE_END, "All operations completed successfully"),
+    EventSpec(EventKind.PHASE_START, "─── ", r"─── (?!All operations)(.+?) ───"),
+    EventSpec(EventKind.ERROR, "ERROR", r"\bERROR\b\s+(.*)"),
+    EventSpec(EventKind.ERROR, "CRITICAL", r"\bCRITICAL\b\s+(.*)"),
+]
+
+osa_event_parser = EventParser(OSA_EVENT_SPECS)
+
+
+def parse_osa_line(line: str) -> OsaEvent | None:
+    return osa_event_parser.parse(line)
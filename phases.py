@@ -0,0 +1,69 @@
+import threading
+import time
+from dataclasses import dataclass
+
+
+@dataclass
+class Phase:
+    name: str
+    started_at: float
+    finished_at: float | None = None
+
+    def duration(self, now: float | None = None) -> float:
+        end = self.finished_at if self.finished_at is not None else now or time.time()
+        return end - self.started_at
+
+
+class PhaseTimeline:
+    """Stages of an osa-tool run with their start and end times.
+
+    osa-tool runs its stages one after another, so starting a phase ends the
+    previous one. Time outside of any phase, e.g. between cloning and the first
+    stage, is only part of the total.
+    """
+
+    def __init__(self) -> None:
+        self._phases: list[Phase] = []
+        self._lock = threading.Lock()
+
+    def start(self, name: str, at: float | None = None) -> None:
+        at = at or time.time()
+        with self._lock:
+            self._finish_current(at)
+            self._phases.append(Phase(name, at))
+
+    def finish(self, name: str | None = None, at: float | None = None) -> None:
+        """End the current phase, if it is `name` or no name is given."""
+        with self._lock:
+            if self._phases and name in (None, self._phases[-1].name):
+                self._finish_current(at or time.time())
+
+    def close(self, at: float | None = None) -> None:
+        with self._lock:
+            self._finish_current(at or time.time())
+
+    def _finish_current(self, at: float) -> None:
+        if self._phases and self._phases[-1].finished_at is None:
+            self._phases[-1].finished_at = at
+
+    @property
+    def current(self) -> Phase | None:
+        with self._lock:
+            if self._phases and self._phases[-1].finished_at is None:
+                return self._phases[-1]
+        return None
+
+    def phases(self) -> list[Phase]:
+        with self._lock:
+            return [
+                Phase(phase.name, phase.started_at, phase.finished_at)
+                for phase in self._phases
+            ]
+
+    def durations(self) -> dict[str, float]:
+        """Return the seconds spent in every phase, a repeated phase summed up."""
+        now = time.time()
+        durations: dict[str, float] = {}
+        for phase in self.phases():
+            durations[phase.name] = durations.get(phase.name, 0.0) + phase.duration(now)
+        return durations
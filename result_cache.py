@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from logger_config import logger
+
+META_FILE = "meta.json"
+
+
+def resolve_head_sha(
+    repo_url: str, branch: str, env: dict[str, str] | None = None, timeout: float = 15
+) -> str | None:
+    """Resolve the commit the branch (or the default branch) points to."""
+    ref = f"refs/heads/{branch}" if branch else "HEAD"
+    try:
+        result = subprocess.run(
+            ["git", "ls-remote", repo_url, ref],
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+            env={**(env or os.environ), "GIT_TERMINAL_PROMPT": "0"},
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Could not resolve {ref} of {repo_url}: {e!s}")
+        return None
+    if result.returncode != 0 or not result.stdout.strip():
+        logger.warning(
+            f"Could not resolve {ref} of {repo_url}: {result.stderr.strip()}"
+        )
+        return None
+    return result.stdout.split()[0]
+
+
+def _normalize_cmd(cmd: list[str]) -> list[str]:
+    """Drop run-specific paths from the osa-tool argv.
+
+    The output directory differs per session, and uploaded attachments get a
+    random file name, so the latter is replaced with a hash of its content.
+    """
+    normalized = []
+    args = iter(cmd)
+    for arg in args:
+        normalized.append(arg)
+        if arg == "-o":
+            next(args, None)
+        elif arg == "--attachment":
+            attachment = next(args, "")
+            if os.path.isfile(attachment):
+                with open(attachment, "rb") as file:
+                    attachment = hashlib.file_digest(file, "sha256").hexdigest()
+            normalized.append(attachment)
+    return normalized
+
+
+def result_cache_key(repo_url: str, head_sha: str, cmd: list[str]) -> str:
+    payload = json.dumps([repo_url.rstrip("/"), head_sha, _normalize_cmd(cmd)])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """Persistent cache of successful osa-tool results.
+
+    Every entry is a directory holding the PDF reports and a `meta.json` with
+    the about section and the exit message. Hits refresh the entry mtime, and
+    the least recently used entries are evicted above `max_size` bytes or
+    `max_entries` entries.
+    """
+
+    def __init__(self, path: str, max_size: int, max_entries: int) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def get(self, key: str, output_dir: str) -> dict | None:
+        """Return cached metadata, with reports copied into `output_dir`."""
+        entry = os.path.join(self.path, key)
+        with self._lock:
+            try:
+                with open(os.path.join(entry, META_FILE)) as file:
+                    meta = json.load(file)
+                os.utime(entry)
+            except (OSError, ValueError):
+                return None
+            report_dir = tempfile.mkdtemp(prefix="cached_", dir=output_dir)
+            meta["report_paths"] = []
+            for filename in meta["report_filenames"]:
+                report_path = os.path.join(report_dir, filename)
+                try:
+                    os.link(os.path.join(entry, filename), report_path)
+                except OSError:
+                    shutil.copyfile(os.path.join(entry, filename), report_path)
+                meta["report_paths"].append(report_path)
+        return meta
+
+    def put(
+        self,
+        key: str,
+        report_paths: list[str],
+        about_section: str | None,
+        message: str,
+    ) -> None:
+        entry = os.path.join(self.path, key)
+        staging = tempfile.mkdtemp(prefix=".staging_", dir=self.path)
+        try:
+            filenames = []
+            for report_path in report_paths:
+                filename = os.path.basename(report_path)
+                shutil.copyfile(report_path, os.path.join(staging, filename))
+                filenames.append(filename)
+            with open(os.path.join(staging, META_FILE), "w") as file:
+                json.dump(
+                    {
+                        "report_filenames": filenames,
+                        "about_section": about_section,
+                        "message": message,
+                        "created_at": time.time(),
+                    },
+                    file,
+                )
+            with self._lock:
+                shutil.rmtree(entry, ignore_errors=True)
+                os.rename(staging, entry)
+                self._evict()
+        except OSError as e:
+            logger.warning(f"Could not cache result {key}: {e!s}")
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _evict(self) -> None:
+        entries = []
+        for name in os.listdir(self.path):
+            entry = os.path.join(self.path, name)
+            if name.startswith(".staging_"):
+                continue
+            try:
+                size = sum(
+                    os.path.getsize(os.path.join(entry, filename))
+                    for filename in os.listdir(entry)
+                )
+                entries.append((os.path.getmtime(entry), size, entry))
+            except OSError:
+                continue
+        entries.sort()
+        total_size = sum(size for _, size, _ in entries)
+        while entries and (
+            total_size > self.max_size or len(entries) > self.max_entries
+        ):
+            _, size, entry = entries.pop(0)
+            shutil.rmtree(entry, ignore_errors=True)
+            total_size -= size
+            logger.info(f"Evicted cached result {os.path.basename(entry)}")
@@ -0,0 +1,372 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+
+import streamlit as st
+
+from config_store import get_base_configuration
+from logger_config import logger
+from sandbox import REASON_INTERRUPTED, REASON_MESSAGES, is_running, process_identity
+
+DATABASE_FILE = "runs.db"
+ARTIFACTS_DIR = "runs"
+
+_COLUMNS = (
+    "id",
+    "user_id",
+    "user",
+    "repo_url",
+    "branch",
+    "mode",
+    "batch_id",
+    "config_version",
+    "status",
+    "exit_code",
+    "message",
+    "termination_reason",
+    "cached",
+    "pr_link",
+    "about_section",
+    "submitted_at",
+    "started_at",
+    "finished_at",
+    "phase_durations",
+    "peak_rss",
+    "cpu_seconds",
+    "output_lines",
+    "report_paths",
+    "report_filenames",
+    "log_path",
+    "owner",
+    "process",
+    "cgroup",
+)
+# NOTE: Statuses of jobs.py, which imports this module
+_UNFINISHED_STATUSES = ("queued", "running")
+
+
+@dataclass
+class RunRecord:
+    """A finished run as kept in the run history."""
+
+    id: str
+    user_id: str
+    user: str
+    repo_url: str
+    branch: str
+    mode: str
+    batch_id: str | None
+    config_version: int | None
+    status: str
+    exit_code: int | None
+    message: str
+    termination_reason: str | None
+    cached: bool
+    pr_link: str | None
+    about_section: str | None
+    submitted_at: float
+    started_at: float | None
+    finished_at: float | None
+    phase_durations: dict[str, float] = field(default_factory=dict)
+    peak_rss: int | None = None
+    cpu_seconds: float | None = None
+    output_lines: int = 0
+    report_paths: list[str] = field(default_factory=list)
+    report_filenames: list[str] = field(default_factory=list)
+    log_path: str | None = None
+    owner: str | None = None
+    process: str | None = None
+    cgroup: str | None = None
+
+    @classmethod
+    def from_job(cls, job) -> "RunRecord":
+        return cls(
+            id=job.id,
+            user_id=job.user_id,
+            user=job.user,
+            repo_url=job.repo_url,
+            branch=job.branch,
+            mode=job.mode,
+            batch_id=job.batch_id,
+            config_version=job.config_version,
+            status=job.status,
+            exit_code=-1 if job.error is not None else job.output_exit_code,
+            message=(
+                f"**Error running OSA tool**: `{job.error}`"
+                if job.error is not None
+                else job.output_message
+            ),
+            termination_reason=job.termination_reason,
+            cached=job.cached,
+            pr_link=job.pr_link,
+            about_section=job.output_about_section,
+            submitted_at=job.submitted_at,
+            started_at=job.started_at,
+            finished_at=job.finished_at,
+            phase_durations=job.timeline.durations(),
+            peak_rss=job.peak_rss,
+            cpu_seconds=job.cpu_seconds,
+            output_lines=job.output_lines,
+            report_paths=list(job.output_report_paths),
+            report_filenames=list(job.output_report_filenames),
+            log_path=job.run_log.path,
+        )
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "RunRecord":
+        values = dict(row)
+        values["cached"] = bool(values["cached"])
+        for key in ("phase_durations", "report_paths", "report_filenames"):
+            values[key] = json.loads(values[key])
+        return cls(**values)
+
+    def to_row(self) -> tuple:
+        values = {key: getattr(self, key) for key in _COLUMNS}
+        for key in ("phase_durations", "report_paths", "report_filenames"):
+            values[key] = json.dumps(values[key])
+        return tuple(values[key] for key in _COLUMNS)
+
+    @property
+    def done(self) -> bool:
+        return self.status not in _UNFINISHED_STATUSES
+
+    @property
+    def duration(self) -> float | None:
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+class RunHistory:
+    """Runs of all users in a SQLite database under `path`.
+
+    A run is added when it is queued and updated once its osa-tool process
+    starts, so the runs of an app process that died can be found and stopped.
+    Reports and run logs of finished runs are linked (or copied) into a
+    directory per run next to the database, so they outlive the session
+    directories the janitor removes. Runs are indexed by user, repository
+    and submission time, and are pruned with their files after `retention`
+    seconds.
+    """
+
+    def __init__(self, path: str, retention: float) -> None:
+        self.path = path
+        self.retention = retention
+        self.owner = process_identity(os.getpid())
+        os.makedirs(os.path.join(path, ARTIFACTS_DIR), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(path, DATABASE_FILE),
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(
+            f"""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS runs (
+                {", ".join(_COLUMNS)}, PRIMARY KEY (id)
+            );
+            CREATE INDEX IF NOT EXISTS runs_user
+                ON runs (user_id, submitted_at);
+            CREATE INDEX IF NOT EXISTS runs_user_repo
+                ON runs (user_id, repo_url, submitted_at);
+            CREATE INDEX IF NOT EXISTS runs_submitted ON runs (submitted_at);
+            CREATE INDEX IF NOT EXISTS runs_status ON runs (status);
+            """
+        )
+        existing = {row["name"] for row in self._db.execute("PRAGMA table_info(runs)")}
+        for column in _COLUMNS:
+            if column not in existing:
+                self._db.execute(f"ALTER TABLE runs ADD COLUMN {column}")
+
+    def _insert(self, run: RunRecord) -> None:
+        run.owner = self.owner
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO runs VALUES "
+                f"({', '.join('?' * len(_COLUMNS))})",
+                run.to_row(),
+            )
+
+    def _artifacts_dir(self, run_id: str) -> str:
+        return os.path.join(self.path, ARTIFACTS_DIR, run_id)
+
+    def _keep(self, path: str, artifacts_dir: str) -> str:
+        kept_path = os.path.join(artifacts_dir, os.path.basename(path))
+        try:
+            os.link(path, kept_path)
+        except OSError:
+            shutil.copyfile(path, kept_path)
+        return kept_path
+
+    def submitted(self, job) -> None:
+        """Add a queued job."""
+        try:
+            self._insert(RunRecord.from_job(job))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not add job {job.id} to the run history: {e!s}")
+
+    def started(self, job, pid: int | None = None, cgroup: str | None = None) -> None:
+        """Mark a job as running, in the osa-tool process group `pid` if given."""
+        try:
+            with self._lock:
+                self._db.execute(
+                    "UPDATE runs SET status = ?, started_at = ?, process = ?, "
+                    "cgroup = ? WHERE id = ?",
+                    (
+                        job.status,
+                        job.started_at,
+                        pid and process_identity(pid),
+                        cgroup,
+                        job.id,
+                    ),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not update job {job.id} in the run history: {e!s}")
+
+    def record(self, job) -> None:
+        """Add a finished job, with its reports and run log."""
+        run = RunRecord.from_job(job)
+        artifacts_dir = self._artifacts_dir(run.id)
+        try:
+            os.makedirs(artifacts_dir, exist_ok=True)
+            run.report_paths = [
+                self._keep(path, artifacts_dir) for path in run.report_paths
+            ]
+            if run.log_path is not None and os.path.exists(run.log_path):
+                run.log_path = self._keep(run.log_path, artifacts_dir)
+            else:
+                run.log_path = None
+            self._insert(run)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Could not add job {job.id} to the run history: {e!s}")
+            shutil.rmtree(artifacts_dir, ignore_errors=True)
+            return
+        self.prune()
+
+    def orphans(self) -> list[RunRecord]:
+        """Return unfinished runs of app processes that are no longer running."""
+        try:
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT * FROM runs WHERE status IN "
+                    f"({', '.join('?' * len(_UNFINISHED_STATUSES))})",
+                    _UNFINISHED_STATUSES,
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not look up unfinished runs: {e!s}")
+            return []
+        return [
+            run
+            for run in map(RunRecord.from_row, rows)
+            if run.owner != self.owner and not (run.owner and is_running(run.owner))
+        ]
+
+    def interrupt(self, run: RunRecord) -> None:
+        """Mark an orphaned run as stopped, keeping its log if it still exists."""
+        log_path = None
+        if run.log_path is not None and os.path.exists(run.log_path):
+            artifacts_dir = self._artifacts_dir(run.id)
+            try:
+                os.makedirs(artifacts_dir, exist_ok=True)
+                log_path = self._keep(run.log_path, artifacts_dir)
+            except OSError as e:
+                logger.warning(f"Could not keep the log of run {run.id}: {e!s}")
+        try:
+            with self._lock:
+                self._db.execute(
+                    "UPDATE runs SET status = 'failed', exit_code = -1, "
+                    "message = ?, termination_reason = ?, finished_at = ?, "
+                    "log_path = ?, process = NULL, cgroup = NULL WHERE id = ?",
+                    (
+                        "**OSA tool was stopped**: "
+                        f"{REASON_MESSAGES[REASON_INTERRUPTED]}",
+                        REASON_INTERRUPTED,
+                        time.time(),
+                        log_path,
+                        run.id,
+                    ),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not update run {run.id} in the run history: {e!s}")
+
+    def prune(self) -> None:
+        """Remove runs older than the retention period, with their files."""
+        if not self.retention:
+            return
+        deadline = time.time() - self.retention
+        try:
+            with self._lock:
+                expired = [
+                    row["id"]
+                    for row in self._db.execute(
+                        "SELECT id FROM runs WHERE submitted_at < ?", (deadline,)
+                    )
+                ]
+                self._db.execute("DELETE FROM runs WHERE submitted_at < ?", (deadline,))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not prune the run history: {e!s}")
+            return
+        for run_id in expired:
+            shutil.rmtree(self._artifacts_dir(run_id), ignore_errors=True)
+        if expired:
+            logger.info(f"Removed {len(expired)} expired runs from the run history")
+
+    @staticmethod
+    def _filter(user_id: str, repo_url: str | None) -> tuple[str, tuple]:
+        if repo_url is None:
+            return "user_id = ?", (user_id,)
+        return "user_id = ? AND repo_url = ?", (user_id, repo_url)
+
+    def count(self, user_id: str, repo_url: str | None = None) -> int:
+        where, params = self._filter(user_id, repo_url)
+        with self._lock:
+            return self._db.execute(
+                f"SELECT COUNT(*) FROM runs WHERE {where}", params
+            ).fetchone()[0]
+
+    def page(
+        self, user_id: str, page: int, page_size: int, repo_url: str | None = None
+    ) -> list[RunRecord]:
+        """Return the `page`-th (0-based) page of the user's runs, newest first."""
+        where, params = self._filter(user_id, repo_url)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT * FROM runs WHERE {where} "
+                "ORDER BY submitted_at DESC LIMIT ? OFFSET ?",
+                (*params, page_size, page * page_size),
+            ).fetchall()
+        return [RunRecord.from_row(row) for row in rows]
+
+    def get(self, run_id: str) -> RunRecord | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM runs WHERE id = ?", (run_id,)
+            ).fetchone()
+        return row and RunRecord.from_row(row)
+
+    def repositories(self, user_id: str) -> list[str]:
+        with self._lock:
+            return [
+                row[0]
+                for row in self._db.execute(
+                    "SELECT DISTINCT repo_url FROM runs WHERE user_id = ? "
+                    "ORDER BY repo_url",
+                    (user_id,),
+                )
+            ]
+
+
+@st.cache_resource
+def get_run_history() -> RunHistory | None:
+    history_config = get_base_configuration()["history"]
+    if not history_config["enabled"]:
+        return None
+    return RunHistory(
+        history_config["path"], retention=history_config["retention"] * 86400
+    )
@@ -0,0 +1,224 @@
+import os
+import resource
+import signal
+import threading
+import uuid
+from dataclasses import dataclass
+
+from logger_config import logger
+
+REASON_TIMEOUT = "timeout"
+REASON_CPU = "cpu"
+REASON_OOM = "oom"
+REASON_FILE_SIZE = "file_size"
+REASON_CANCELLED = "cancelled"
+REASON_INTERRUPTED = "interrupted"
+REASON_KILLED = "killed"
+
+CPU_HARD_LIMIT_GRACE = 5
+
+REASON_MESSAGES = {
+    REASON_TIMEOUT: "the run exceeded its wall-clock limit",
+    REASON_CPU: "the run exceeded its CPU time limit",
+    REASON_OOM: "the run ran out of memory",
+    REASON_FILE_SIZE: "the run exceeded its file size limit",
+    REASON_CANCELLED: "the run was cancelled",
+    REASON_INTERRUPTED: "the server restarted during the run",
+    REASON_KILLED: "the run was killed",
+}
+
+
+def _boot_id() -> str:
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as file:
+            return file.read().strip()
+    except OSError:
+        return ""
+
+
+def process_identity(pid: int) -> str | None:
+    """Return an ID of a running process that a later process reusing its pid never gets."""
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            stat = file.read()
+    except OSError:
+        return None
+    # NOTE: Fields are counted after the command name, which may contain spaces
+    start_time = stat.rsplit(")", 1)[1].split()[19]
+    return f"{_boot_id()}:{pid}:{start_time}"
+
+
+def is_running(identity: str) -> bool:
+    """Check whether the process of a `process_identity` is still running."""
+    return process_identity(int(identity.split(":")[1])) == identity
+
+
+@dataclass(frozen=True)
+class ExecutionProfile:
+    """Resource limits of an osa-tool run, 0 meaning unlimited.
+
+    Sizes are in megabytes and times in seconds.
+    """
+
+    wall_time: int = 0
+    cpu_time: int = 0
+    memory: int = 0
+    file_size: int = 0
+    kill_grace: int = 10
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ExecutionProfile":
+        return cls(
+            wall_time=config.get("wall-time", 0),
+            cpu_time=config.get("cpu-time", 0),
+            memory=config.get("memory", 0),
+            file_size=config.get("file-size", 0),
+            kill_grace=config.get("kill-grace", 10),
+        )
+
+
+class Sandbox:
+    """Applies an execution profile to a started process.
+
+    The process must lead its own process group (`start_new_session=True`),
+    so the whole osa-tool tree, including git, can be signalled at once.
+    rlimits are set on the process with prlimit and inherited by children
+    it starts afterwards. If `cgroup_root` points at a delegated cgroup v2
+    directory, the tree is also moved into its own cgroup with a memory
+    limit covering all of its processes.
+    """
+
+    def __init__(self, profile: ExecutionProfile, cgroup_root: str = "") -> None:
+        self.profile = profile
+        self.cgroup_root = cgroup_root
+        self.cgroup: str | None = None
+        self.pid: int | None = None
+        self.cancelled = False
+        self._oom_kills = 0
+        self._kill_timer: threading.Timer | None = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def adopt(
+        cls, pid: int, cgroup: str | None, profile: ExecutionProfile
+    ) -> "Sandbox":
+        """Return the sandbox of a process group started by an earlier app process."""
+        sandbox = cls(profile)
+        sandbox.pid = pid
+        sandbox.cgroup = cgroup
+        if cgroup:
+            sandbox._oom_kills = sandbox._oom_kill_count()
+        return sandbox
+
+    def apply(self, pid: int) -> None:
+        self.pid = pid
+        limits = (
+            (resource.RLIMIT_CPU, self.profile.cpu_time),
+            (resource.RLIMIT_AS, self.profile.memory * 1024 * 1024),
+            (resource.RLIMIT_FSIZE, self.profile.file_size * 1024 * 1024),
+        )
+        for limit, value in limits:
+            if value:
+                # NOTE: SIGXCPU is only sent below the hard CPU limit, leave it
+                # some headroom so CPU exhaustion is told apart from SIGKILL
+                hard = (
+                    value + CPU_HARD_LIMIT_GRACE
+                    if limit == resource.RLIMIT_CPU
+                    else value
+                )
+                try:
+                    resource.prlimit(pid, limit, (value, hard))
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Could not set rlimit {limit} of {pid}: {e!s}")
+        if self.cgroup_root:
+            self._create_cgroup(pid)
+
+    def _create_cgroup(self, pid: int) -> None:
+        cgroup = os.path.join(self.cgroup_root, f"osa-run-{uuid.uuid4().hex[:12]}")
+        try:
+            os.mkdir(cgroup)
+            if self.profile.memory:
+                with open(os.path.join(cgroup, "memory.max"), "w") as file:
+                    file.write(str(self.profile.memory * 1024 * 1024))
+                with open(os.path.join(cgroup, "memory.swap.max"), "w") as file:
+                    file.write("0")
+            with open(os.path.join(cgroup, "cgroup.procs"), "w") as file:
+                file.write(str(pid))
+        except OSError as e:
+            logger.warning(f"Could not use cgroup {cgroup}, using rlimits only: {e!s}")
+            self._remove_cgroup(cgroup)
+            return
+        self.cgroup = cgroup
+
+    def kill(self, sig: int = signal.SIGKILL) -> None:
+        """Signal every process of the run."""
+        with self._lock:
+            # NOTE: The process group id may be reused once the run is closed
+            if self.pid is None:
+                return
+            if sig == signal.SIGKILL and self.cgroup:
+                try:
+                    with open(os.path.join(self.cgroup, "cgroup.kill"), "w") as file:
+                        file.write("1")
+                except OSError:
+                    pass
+            try:
+                os.killpg(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def cancel(self) -> None:
+        """Stop the run from any thread, escalating to SIGKILL after the grace period."""
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            self._kill_timer = threading.Timer(
+                self.profile.kill_grace, self.kill, (signal.SIGKILL,)
+            )
+            self._kill_timer.daemon = True
+        self.kill(signal.SIGTERM)
+        self._kill_timer.start()
+
+    def termination_reason(self, returncode: int, timed_out: bool) -> str | None:
+        if self.cancelled:
+            return REASON_CANCELLED
+        if timed_out:
+            return REASON_TIMEOUT
+        if self.cgroup and self._oom_kill_count() > self._oom_kills:
+            return REASON_OOM
+        if returncode == -signal.SIGXCPU:
+            return REASON_CPU
+        if returncode == -signal.SIGXFSZ:
+            return REASON_FILE_SIZE
+        if returncode == -signal.SIGKILL and (
+            self.profile.memory or self.profile.cpu_time
+        ):
+            # NOTE: Only the cgroup tells an OOM kill apart from the hard CPU
+            # limit or a SIGKILL from outside the sandbox
+            return REASON_KILLED
+        return None
+
+    def _oom_kill_count(self) -> int:
+        try:
+            with open(os.path.join(self.cgroup, "memory.events")) as file:
+                events = dict(line.split() for line in file)
+        except (OSError, ValueError):
+            return 0
+        return int(events.get("oom_kill", 0))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._kill_timer is not None:
+                self._kill_timer.cancel()
+            self.pid = None
+            if self.cgroup:
+                self._remove_cgroup(self.cgroup)
+                self.cgroup = None
+
+    @staticmethod
+    def _remove_cgroup(cgroup: str) -> None:
+        try:
+            os.rmdir(cgroup)
+        except OSError:
+            pass
@@ -0,0 +1,163 @@
+import email.utils
+import errno
+import os
+import re
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+from urllib.parse import quote
+
+import streamlit as st
+
+from config_store import get_base_configuration
+from logger_config import logger
+
+RouteHandler = Callable[[BaseHTTPRequestHandler, str], None]
+
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "SidecarServer"
+
+    def do_GET(self) -> None:
+        self.server.dispatch(self)
+
+    def do_HEAD(self) -> None:
+        self.server.dispatch(self)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(f"Sidecar {self.address_string()}: {format % args}")
+
+
+class SidecarServer(ThreadingHTTPServer):
+    """Small HTTP server next to Streamlit for endpoints Streamlit lacks.
+
+    Routes are registered by path prefix; the handler receives the request
+    and the rest of the path after the prefix.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str, port: int, public_url: str) -> None:
+        super().__init__((host, port), _RequestHandler)
+        self.public_url = public_url.rstrip("/")
+        self._routes: dict[str, RouteHandler] = {}
+
+    def add_route(self, prefix: str, handler: RouteHandler) -> None:
+        self._routes[prefix] = handler
+
+    def url_for(self, path: str) -> str:
+        return f"{self.public_url}{path}"
+
+    def dispatch(self, request: BaseHTTPRequestHandler) -> None:
+        path = request.path.split("?", 1)[0]
+        for prefix, handler in self._routes.items():
+            if path.startswith(prefix):
+                try:
+                    handler(request, path[len(prefix) :])
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                except Exception as e:
+                    logger.error(f"Sidecar request {path} failed: {e!s}", exc_info=True)
+                return
+        request.send_error(HTTPStatus.NOT_FOUND)
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, name="sidecar", daemon=True).start()
+        logger.info(f"Sidecar server listening on {self.server_address}")
+
+
+def serve_file(
+    request: BaseHTTPRequestHandler,
+    path: str,
+    filename: str,
+    content_type: str,
+) -> None:
+    """Send a file with ETag and single byte-range support, using sendfile."""
+    try:
+        file = open(path, "rb")
+    except OSError:
+        request.send_error(HTTPStatus.NOT_FOUND)
+        return
+    with file:
+        stat = os.fstat(file.fileno())
+        etag = f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        if request.headers.get("If-None-Match") == etag:
+            request.send_response(HTTPStatus.NOT_MODIFIED)
+            request.send_header("ETag", etag)
+            request.end_headers()
+            return
+
+        start, end = 0, stat.st_size - 1
+        status = HTTPStatus.OK
+        range_header = request.headers.get("Range")
+        # NOTE: Multiple ranges are answered with the whole file, as RFC 9110 allows
+        if (
+            range_header
+            and "," not in range_header
+            and request.headers.get("If-Range", etag) == etag
+        ):
+            match = _RANGE_RE.match(range_header.strip())
+            if match is None or match.groups() == ("", ""):
+                request.send_error(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                return
+            first, last = match.groups()
+            if first:
+                start = int(first)
+                end = min(int(last), end) if last else end
+            else:
+                start = max(0, stat.st_size - int(last))
+            if start > end:
+                request.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                request.send_header("Content-Range", f"bytes */{stat.st_size}")
+                request.send_header("Content-Length", "0")
+                request.end_headers()
+                return
+            status = HTTPStatus.PARTIAL_CONTENT
+
+        length = end - start + 1
+        request.send_response(status)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(length))
+        request.send_header("Accept-Ranges", "bytes")
+        request.send_header("ETag", etag)
+        request.send_header(
+            "Last-Modified", email.utils.formatdate(stat.st_mtime, usegmt=True)
+        )
+        request.send_header("Cache-Control", "private, max-age=3600")
+        request.send_header(
+            "Content-Disposition", f"attachment; filename*=UTF-8''{quote(filename)}"
+        )
+        if status == HTTPStatus.PARTIAL_CONTENT:
+            request.send_header("Content-Range", f"bytes {start}-{end}/{stat.st_size}")
+        request.end_headers()
+        if request.command != "HEAD" and length > 0:
+            request.wfile.flush()
+            request.connection.sendfile(file, start, length)
+
+
+@st.cache_resource
+def get_sidecar() -> SidecarServer:
+    config = get_base_configuration()["sidecar"]
+    ports = range(config["port"], config["port"] + config["port-count"])
+    for port in ports:
+        try:
+            server = SidecarServer(
+                config["host"], port, config["public-url"].replace("{port}", str(port))
+            )
+        except OSError as e:
+            # NOTE: Another app process on this host holds the port
+            if e.errno != errno.EADDRINUSE:
+                raise
+            logger.warning(f"Sidecar port {port} is in use, trying the next one")
+            continue
+        server.start()
+        return server
+    raise OSError(
+        errno.EADDRINUSE,
+        f"Sidecar ports {ports.start}-{ports.stop - 1} are all in use, "
+        "raise sidecar.port-count",
+    )
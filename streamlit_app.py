@@ -1,15 +1,18 @@
 import os
 import tempfile
-from typing import Any
 
 import streamlit as st
-import toml
 from dotenv import load_dotenv
 
+from batch_tab import render_batch_tab
+from config_store import SessionConfiguration, get_base_configuration
 from configuration_tab import render_configuration_tab
-from logger_config import logger
+from history_tab import render_history_tab
+from janitor import get_janitor
+from logger_config import logger, set_log_context
 from login_screen import render_login_screen
-from main_tab import render_main_tab
+from main_tab import reattach_osa_job, render_main_tab
+from metrics import get_metrics_exporter
 from sidebar_element import render_sidebar_element
 
 load_dotenv()
@@ -29,29 +32,50 @@ def setup_page_config() -> None:
     )
 
 
-@st.cache_data
-def get_config() -> dict[str, Any]:
-    return toml.load("config.toml")
-
-
 def main() -> None:
     """Run the Streamlit application."""
 
     setup_page_config()
+    get_metrics_exporter()
 
     if not st.user.is_logged_in:
         render_login_screen()
         st.stop()
 
+    set_log_context(user=st.user.get("email") or st.user.get("name", "Username"))
     logger.info(f"User {st.user.get("name", "Username")} logged in!")
 
-    if "running" not in st.session_state:
+    new_session = "running" not in st.session_state
+    if new_session:
         st.session_state.running = False
     if "configuration" not in st.session_state:
-        st.session_state.configuration = {**get_config()}
+        st.session_state.configuration = SessionConfiguration(get_base_configuration())
+    else:
+        # NOTE: Sessions pick up a reloaded config.toml, keeping their own edits
+        st.session_state.configuration.rebase(get_base_configuration())
+    janitor = get_janitor()
     if "tmpdirname" not in st.session_state:
-        st.session_state.tmpdirname = tempfile.mkdtemp(dir=get_config()["paths"]["tmp"])
+        st.session_state.tmpdirname = tempfile.mkdtemp(
+            dir=st.session_state.configuration["paths"]["tmp"]
+        )
         logger.debug(f"Created tmp directory: {st.session_state.tmpdirname}")
+    elif not os.path.isdir(st.session_state.tmpdirname):
+        # NOTE: Directories of idle sessions are reclaimed by the janitor
+        os.makedirs(st.session_state.tmpdirname)
+        for key in (
+            "output_logs",
+            "output_log_path",
+            "output_log_url",
+            "output_report_paths",
+            "output_report_urls",
+            "output_report_filenames",
+            "output_timeline",
+            "attachment",
+        ):
+            if key in st.session_state:
+                del st.session_state[key]
+        logger.debug(f"Recreated tmp directory: {st.session_state.tmpdirname}")
+    janitor.touch(st.session_state.tmpdirname)
     if "output_report_paths" not in st.session_state:
         st.session_state.output_report_paths = []
     if "output_report_filenames" not in st.session_state:
@@ -59,11 +83,16 @@ def main() -> None:
     if "git_token" not in st.session_state:
         st.session_state.git_token = os.getenv("GIT_TOKEN")
 
+    if new_session and "job" in st.query_params:
+        reattach_osa_job(st.query_params["job"])
+
     render_sidebar_element()
 
-    tab1, tab2 = st.tabs(
+    tab1, tab2, tab3, tab4 = st.tabs(
         [
             ":material/home: Home",
+            ":material/stacks: Batch",
+            ":material/history: My runs",
             ":material/settings: Configuration",
         ]
     )
@@ -71,6 +100,12 @@ def main() -> None:
         render_main_tab()
 
     with tab2:
+        render_batch_tab()
+
+    with tab3:
+        render_history_tab()
+
+    with tab4:
         render_configuration_tab()
 
 
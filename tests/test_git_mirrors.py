@@ -0,0 +1,121 @@
+import os
+import subprocess
+
+import pytest
+
+from git_mirrors import GitMirrorCache
+
+
+def _git(*args: str, env: dict[str, str] | None = None) -> str:
+    return subprocess.run(
+        ["git", *args],
+        check=True,
+        capture_output=True,
+        text=True,
+        env={**os.environ, **(env or {})},
+    ).stdout.strip()
+
+
+@pytest.fixture
+def origin(tmp_path) -> str:
+    """A local bare repository with a single commit on `main`."""
+    work = tmp_path / "work"
+    _git("init", "--quiet", "--initial-branch", "main", str(work))
+    (work / "README.md").write_text("mirror test\n")
+    _git("-C", str(work), "add", "README.md")
+    _git(
+        "-C",
+        str(work),
+        "-c",
+        "user.name=test",
+        "-c",
+        "user.email=test@example.com",
+        "commit",
+        "--quiet",
+        "-m",
+        "Initial commit",
+    )
+    origin = tmp_path / "origin.git"
+    _git("clone", "--bare", "--quiet", str(work), str(origin))
+    return str(origin)
+
+
+@pytest.fixture
+def mirrors(tmp_path) -> GitMirrorCache:
+    return GitMirrorCache(
+        str(tmp_path / "mirrors"), max_size=2**30, refresh_interval=3600, timeout=60
+    )
+
+
+def test_fetch_resolves_to_mirror(origin, mirrors, tmp_path):
+    with mirrors.use(origin) as env:
+        assert env
+        mirror_path = mirrors.update(origin)
+        assert _git("ls-remote", "--get-url", origin, env=env) == mirror_path
+
+        clone = tmp_path / "clone"
+        _git("clone", "--quiet", origin, str(clone), env=env)
+        assert (clone / "README.md").read_text() == "mirror test\n"
+    assert _git("-C", mirror_path, "rev-parse", "main") == _git(
+        "-C", origin, "rev-parse", "main"
+    )
+
+
+def test_push_goes_to_original_url(origin, mirrors, tmp_path):
+    clone = tmp_path / "clone"
+    with mirrors.use(origin) as env:
+        _git("clone", "--quiet", origin, str(clone), env=env)
+        push_url = _git(
+            "-C", str(clone), "remote", "get-url", "--push", "origin", env=env
+        )
+        assert push_url == origin
+        fetch_url = _git("-C", str(clone), "remote", "get-url", "origin", env=env)
+        assert fetch_url == mirrors.update(origin)
+
+
+def test_repository_url_without_git_suffix(origin, mirrors):
+    repo_url = origin.removesuffix(".git")
+    with mirrors.use(repo_url) as env:
+        assert _git("ls-remote", "--get-url", origin, env=env) == mirrors.update(
+            repo_url
+        )
+
+
+def test_mirror_evicted_above_max_size(origin, mirrors):
+    mirrors.max_size = 0
+    name = mirrors._name(origin)
+    with mirrors.use(origin) as env:
+        assert env
+        # NOTE: A mirror in use is never evicted
+        mirrors.evict()
+        assert os.path.isdir(os.path.join(mirrors.path, f"{name}.git"))
+    assert not os.path.exists(os.path.join(mirrors.path, f"{name}.git"))
+    assert not os.path.exists(os.path.join(mirrors.path, f"{name}.meta"))
+
+
+def test_mirror_kept_below_max_size(origin, mirrors):
+    name = mirrors._name(origin)
+    with mirrors.use(origin):
+        pass
+    assert os.path.isdir(os.path.join(mirrors.path, f"{name}.git"))
+
+
+def test_eviction_tolerates_concurrent_removal(origin, mirrors, monkeypatch):
+    mirrors.max_size = 0
+    name = mirrors._name(origin)
+    read_meta = mirrors._read_meta
+
+    def evicted_meanwhile(mirror_name: str) -> dict:
+        meta = read_meta(mirror_name)
+        # NOTE: Another worker removes the mirror once it was listed here
+        os.remove(os.path.join(mirrors.path, f"{mirror_name}.meta"))
+        return meta
+
+    with mirrors.use(origin):
+        monkeypatch.setattr(mirrors, "_read_meta", evicted_meanwhile)
+    assert not os.path.exists(os.path.join(mirrors.path, f"{name}.git"))
+
+
+def test_unreachable_repository_yields_empty_env(mirrors, tmp_path):
+    with mirrors.use(str(tmp_path / "missing.git")) as env:
+        assert env == {}
@@ -1,11 +1,21 @@
 import asyncio
 import numbers
 import os
-import re
+import signal
+from collections import deque
+from collections.abc import Callable
 
 import streamlit as st
 
-from logger_config import logger
+from fork_server import ForkServer, ForkServerError
+from logger_config import get_output_log_policy, logger
+from metrics import ProcessGroupUsage
+from osa_events import EventKind, parse_osa_line
+from sandbox import REASON_MESSAGES, Sandbox
+
+
+# NOTE: Force Unbuffered Output & Adjust Terminal Width
+OSA_ENV = {"COLUMNS": "200", "TERM": "xterm-256color", "PYTHONUNBUFFERED": "1"}
 
 
 def _transform_configuration_to_cmd(cmd: list, configuration: dict):
@@ -17,139 +27,255 @@ def _transform_configuration_to_cmd(cmd: list, configuration: dict):
             cmd.extend((f"--{k}", v))
         elif isinstance(v, numbers.Number) and not isinstance(v, bool):
             cmd.extend((f"--{k}", str(v)))
-        elif isinstance(v, list) and v:
+        elif isinstance(v, (list, tuple)) and v:
             cmd.extend((f"--{k}", ", ".join([str(i) for i in v])))
 
 
-async def run_osa_tool(output_container) -> None:
-    """Run the osa-tools application."""
-    try:
-        # Reset streamlit state
-        if "output_report_paths" in st.session_state:
-            st.session_state["output_report_paths"] = []
-        if "output_report_filenames" in st.session_state:
-            st.session_state["output_report_filenames"] = []
-        if "output_about_section" in st.session_state:
-            del st.session_state["output_about_section"]
-
-        # Создаем копию текущих переменных окружения
-        env = os.environ.copy()
-        # NOTE: Force Unbuffered Output & Adjust Terminal Width
-        env.update(
-            {"COLUMNS": "200", "TERM": "xterm-256color", "PYTHONUNBUFFERED": "1"}
-        )
-        if "configuration-api-key" in st.session_state:
-            env.update({"OPENAI_API_KEY": st.session_state["configuration-api-key"]})
-
-        # Убедимся, что GIT_TOKEN передается в процесс
-        if st.session_state.git_token:
-            env["GIT_TOKEN"] = st.session_state.git_token
-
-        cmd = [
-            "osa-tool",
-            "-r",
-            st.session_state.repo_url,
-            "-m",
-            "basic" if st.session_state.mode_select == "basic" else "advanced",
-            "-o",
-            st.session_state.tmpdirname,
-            "--author",
-            st.user.get("name", "Username"),
-            "--web-mode",
-            # "--delete-dir",
-        ]
-
-        if "attachment" in st.session_state:
-            cmd.extend(("--attachment", st.session_state.attachment.get("data")))
+def build_osa_command(
+    repo_url: str, output_dir: str
+) -> tuple[list[str], dict[str, str]]:
+    """Build the osa-tool command line and environment from the session state."""
+    # Создаем копию текущих переменных окружения
+    env = os.environ.copy()
+    env.update(OSA_ENV)
+    if "configuration-api-key" in st.session_state:
+        env.update({"OPENAI_API_KEY": st.session_state["configuration-api-key"]})
 
-        _transform_configuration_to_cmd(
-            cmd, st.session_state.configuration[st.session_state.mode_select]["git"]
-        )
+    # Убедимся, что GIT_TOKEN передается в процесс
+    if st.session_state.git_token:
+        env["GIT_TOKEN"] = st.session_state.git_token
+
+    cmd = [
+        "osa-tool",
+        "-r",
+        repo_url,
+        "-m",
+        "basic" if st.session_state.mode_select == "basic" else "advanced",
+        "-o",
+        output_dir,
+        "--author",
+        st.user.get("name", "Username"),
+        "--web-mode",
+        # "--delete-dir",
+    ]
+
+    if "attachment" in st.session_state:
+        cmd.extend(("--attachment", st.session_state.attachment.get("data")))
+
+    _transform_configuration_to_cmd(
+        cmd, st.session_state.configuration[st.session_state.mode_select]["git"]
+    )
+    _transform_configuration_to_cmd(
+        cmd,
+        st.session_state.configuration[st.session_state.mode_select]["general"],
+    )
+    _transform_configuration_to_cmd(
+        cmd, st.session_state.configuration[st.session_state.mode_select]["llm"]
+    )
+    if st.session_state.configuration[st.session_state.mode_select]["workflows"][
+        "generate-workflows"
+    ]:
         _transform_configuration_to_cmd(
             cmd,
-            st.session_state.configuration[st.session_state.mode_select]["general"],
-        )
-        _transform_configuration_to_cmd(
-            cmd, st.session_state.configuration[st.session_state.mode_select]["llm"]
+            st.session_state.configuration[st.session_state.mode_select]["workflows"],
         )
-        if st.session_state.configuration[st.session_state.mode_select]["workflows"][
-            "generate-workflows"
-        ]:
-            _transform_configuration_to_cmd(
-                cmd,
-                st.session_state.configuration[st.session_state.mode_select][
-                    "workflows"
-                ],
-            )
 
+    return cmd, env
+
+
+STDOUT = "stdout"
+STDERR = "stderr"
+
+
+async def _drain_stream(
+    stream: asyncio.StreamReader, name: str, queue: asyncio.Queue
+) -> None:
+    """Pump lines of a subprocess stream into the shared output queue."""
+    try:
+        while stream_line := await stream.readline():
+            await queue.put((name, stream_line))
+    finally:
+        await queue.put((name, None))
+
+
+async def _sample_usage(usage: ProcessGroupUsage, interval: float) -> None:
+    """Sample the resource usage of a run until cancelled."""
+    while True:
+        await asyncio.to_thread(usage.sample)
+        await asyncio.sleep(interval)
+
+
+async def _terminate(process: asyncio.subprocess.Process, sandbox: Sandbox) -> None:
+    """Stop the whole process group, escalating to SIGKILL after the grace period."""
+    sandbox.kill(signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), sandbox.profile.kill_grace)
+    except TimeoutError:
+        sandbox.kill(signal.SIGKILL)
+
+
+async def run_osa_tool(
+    job,
+    output_buffer: int = 1000,
+    stderr_tail: int = 50,
+    cgroup_root: str = "",
+    sample_interval: float = 1.0,
+    fork_server: ForkServer | None = None,
+    on_start: Callable[[int, str | None], None] | None = None,
+) -> None:
+    """Run the osa-tools application for a queued job.
+
+    stdout and stderr are drained concurrently, so a chatty stream can never
+    fill its pipe and stall osa-tool while the other one is being read.
+    osa-tool runs in its own process group under the job's execution profile,
+    forked from `fork_server` when given and started as a new process otherwise.
+    Its peak memory and CPU time are sampled every `sample_interval` seconds.
+    `on_start` is called with the process group and cgroup once it started.
+    """
+    process = None
+    if fork_server is not None:
+        try:
+            process = await fork_server.spawn(job.cmd, job.env)
+        except ForkServerError as e:
+            logger.warning(f"{e!s}, starting osa-tool as a new process")
+    if process is None:
         process = await asyncio.create_subprocess_exec(
-            *cmd,
+            *job.cmd,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
-            env=env,
+            env=job.env,
+            start_new_session=True,
         )
+    sandbox = Sandbox(job.profile, cgroup_root)
+    sandbox.apply(process.pid)
+    job.sandbox = sandbox
+    if on_start is not None:
+        on_start(process.pid, sandbox.cgroup)
+    if job.cancel_requested:
+        sandbox.cancel()
+
+    cmd_log_msg = f"Running osa-tool with parameters: {job.cmd}"
+
+    logger.info(cmd_log_msg)
+    job.run_log.append(cmd_log_msg)
+    job.log_view.append(cmd_log_msg)
+    last_line = None
+    last_error = None
+    stderr_lines = deque(maxlen=stderr_tail)
 
-        cmd_log_msg = f"Running osa-tool with parameters: {cmd}"
+    queue = asyncio.Queue(maxsize=output_buffer)
+    pumps = [
+        asyncio.create_task(_drain_stream(process.stdout, STDOUT, queue)),
+        asyncio.create_task(_drain_stream(process.stderr, STDERR, queue)),
+    ]
+    open_streams = len(pumps)
+    usage = ProcessGroupUsage(process.pid, sandbox.cgroup)
+    sampler = asyncio.create_task(_sample_usage(usage, sample_interval))
+    output_lines = 0
+    output_log_policy = get_output_log_policy()
+    timed_out = False
+
+    try:
+        async with asyncio.timeout(job.profile.wall_time or None):
+            while open_streams:
+                stream_name, stream_line = await queue.get()
+                if stream_line is None:
+                    open_streams -= 1
+                    continue
 
-        logger.info(cmd_log_msg)
-        st.session_state.output_logs = cmd_log_msg + "\n"
-        last_line = None
-        pr_link = None
+                line = stream_line.decode(errors="replace").strip()
+                if not line:
+                    continue
+                output_lines += 1
+                log_line = output_log_policy.should_log(output_lines)
 
-        while True:
-            stdout_line = await process.stdout.readline()
-            if not stdout_line:
-                break
+                # NOTE: osa-tool logs errors it recovers from, an error only
+                # explains the failure if nothing was printed after it
+                last_error = None
+                if stream_name == STDERR:
+                    stderr_lines.append(line)
+                    line = f"[stderr] {line}"
+                    if log_line:
+                        logger.log(output_log_policy.level, line)
+                    job.run_log.append(line)
+                    job.log_view.append(line)
+                    continue
 
-            if line := stdout_line.decode().strip():
                 last_line = line
-                if match := re.search(
-                    r"PDF report successfully created in (\/.*.pdf)", line
-                ):
-                    logger.info(f"Created PDF report: {match.group(1)} ")
-                    st.session_state.output_report_paths.append(match.group(1))
-                    st.session_state.output_report_filenames.append(
-                        match.group(1).split("/")[-1]
-                    )
-                if match := re.search(
-                    r"(.*You can add the following.*|.*- Description:.*|.*- Homepage:.*|.*- Topics:.*|.*Please review and add them to your repository.*)",
-                    line,
-                ):
-                    if "output_about_section" not in st.session_state:
-                        st.session_state.output_about_section = ""
-                    st.session_state.output_about_section += line + "\n\n"
-                if match := re.search(
-                    r".*pull request created successfully: (\S*)", line
-                ):
-                    logger.info(f"Created Pull Request: {match.group(1)}")
-                    pr_link = match.group(1)
-
-                logger.debug(line)
-
-                st.session_state.output_logs += line + "\n"
-                # TODO: developer only
-                output_container.expander(
-                    "See Console Output", icon=":material/terminal:"
-                ).code(
-                    st.session_state.output_logs,
-                    height=350,
-                )
-
-        st.session_state.output_exit_code = await process.wait()
-        if st.session_state.output_exit_code == 0:
-            st.session_state.output_message = f'Everything is alright! {f"**Pull Request created**: {pr_link}" if pr_link else ""}'
-        else:
-            stderr_output = await process.stderr.read()
-            error_message = stderr_output.decode().strip()
-            st.session_state.output_message = (
-                f"**Error running OSA tool**: `{last_line}`"
-            )
-            logger.error(
-                f"OSA tool execution failed with code {st.session_state.output_exit_code}: {last_line}"
-            )
-    except Exception as e:
-        st.error(f"Error executing OSA tool: {e!s}")
-        logger.error(f"OSA tool execution failed: {e!s}", exc_info=True)
+                if (event := parse_osa_line(line)) is not None:
+                    match event.kind:
+                        case EventKind.REPORT_CREATED:
+                            logger.info(f"Created PDF report: {event.value} ")
+                            job.output_report_paths.append(event.value)
+                            job.output_report_filenames.append(
+                                event.value.split("/")[-1]
+                            )
+                        case EventKind.ABOUT_LINE:
+                            if job.output_about_section is None:
+                                job.output_about_section = ""
+                            job.output_about_section += line + "\n\n"
+                        case EventKind.PR_CREATED:
+                            logger.info(f"Created Pull Request: {event.value}")
+                            job.pr_link = event.value
+                        case EventKind.PHASE_START:
+                            logger.info(f"Started phase: {event.value}")
+                            job.timeline.start(event.value)
+                        case EventKind.PHASE_END:
+                            job.timeline.finish(event.value)
+                        case EventKind.ERROR:
+                            last_error = event.value
+
+                if log_line:
+                    logger.log(output_log_policy.level, line)
+
+                job.run_log.append(line)
+                job.log_view.append(line)
+    except TimeoutError:
+        timed_out = True
+        logger.warning(f"Run {job.id} exceeded {job.profile.wall_time}s, stopping it")
+        await _terminate(process, sandbox)
+    except BaseException:
+        # NOTE: Never leave osa-tool running behind a failed or cancelled run
+        sandbox.kill(signal.SIGKILL)
+        raise
     finally:
-        st.session_state.running = False
-        st.rerun()
+        for task in (*pumps, sampler):
+            task.cancel()
+        await asyncio.gather(*pumps, sampler, return_exceptions=True)
+
+    job.output_exit_code = await process.wait()
+    job.timeline.close()
+    if phase_durations := job.timeline.durations():
+        logger.info(
+            "Phase durations: "
+            + ", ".join(
+                f"{name} {seconds:.1f}s" for name, seconds in phase_durations.items()
+            )
+        )
+    # NOTE: The cgroup accounts for every process of the run until it is removed
+    usage.sample()
+    job.output_lines = output_lines
+    job.peak_rss = usage.peak_rss
+    job.cpu_seconds = usage.cpu_seconds
+    job.termination_reason = sandbox.termination_reason(job.output_exit_code, timed_out)
+    sandbox.close()
+    job.sandbox = None
+    if job.termination_reason is not None:
+        job.output_message = (
+            f"**OSA tool was stopped**: {REASON_MESSAGES[job.termination_reason]}"
+        )
+        logger.error(f"Run {job.id} was stopped: {job.termination_reason}")
+    elif job.output_exit_code == 0:
+        job.output_message = f'Everything is alright! {f"**Pull Request created**: {job.pr_link}" if job.pr_link else ""}'
+    else:
+        if last_error is not None:
+            last_line = last_error
+        elif last_line is None and stderr_lines:
+            last_line = stderr_lines[-1]
+        job.output_message = f"**Error running OSA tool**: `{last_line}`"
+        logger.error(
+            f"OSA tool execution failed with code {job.output_exit_code}: {last_line}"
+        )
+        if stderr_lines:
+            stderr_output = "\n".join(stderr_lines)
+            logger.error(f"Last lines of osa-tool stderr:\n{stderr_output}")